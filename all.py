@@ -9,21 +9,30 @@ Features added:
 - Nesting preference toggle for bold+italic (<b><i>..</i></b> or <i><b>..</b></i>)
 - Save All Pages (wrapped) — produces nested <section> structures for headings
 Save as: pdf_paratag_editor_all_options.py
-Dependencies: pip install pymupdf pillow
+Dependencies: pip install pymupdf
 """
 
 import fitz
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
 import json
+import pickle
+import sys
 import math
 import re
-import copy
+import functools
+import concurrent.futures
+import queue
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
 
 # ---------- Settings ----------
 AUTO_ENTITIES = True            # default ON
 NESTING_PREF = 'b_outside_i'    # or 'i_outside_b' ; default b outside i
+UNDO_LIMIT = 64                 # max undo / redo steps kept
+PIX_CACHE_MAX = 8               # rendered page images kept in memory
+HTML_DEBOUNCE_MS = 30           # coalesce HTML preview rebuilds within this window
+HTML_POLL_MS = 20               # how often the UI collects finished HTML preview builds
 
 # ---------- State ----------
 class State:
@@ -35,49 +44,103 @@ class State:
         self.drag_start = None
         self.current_rect_id = None
         self.selected_region = None  # (page_idx, idx)
-        self.img_holder = {'pil': None, 'tk': None}
-        self.undo_stack = []
-        self.redo_stack = []
+        self.img_holder = {'size': None, 'tk': None}
+        self.scale_p2i = (1.0, 1.0)  # page -> image coord factors for the displayed pixmap
+        self.scale_i2p = (1.0, 1.0)  # image -> page
+        self.rendered_page = None    # page_idx whose image is currently on the canvas
+        self.id_index = {}           # {page_idx: {region id: idx}}
+        self.region_y_index = {}     # {page_idx: (sorted y0s, [(y0, y1, x0, x1, idx)], max height)}
+        self.region_canvas_ids = []  # [(rect_id, text_id), ...] per region of the displayed page
+        self.html_after = None       # pending root.after id for the HTML preview rebuild
+        self.html_gen = 0            # id of the latest preview build; older results are dropped
+        self.html_shown_gen = 0      # id of the build currently in the preview
+        self.html_pending = 0        # worker builds not yet applied; _poll_html runs while > 0
+        self.undo_stack = deque(maxlen=UNDO_LIMIT)   # [(page_idx or None, regions snapshot), ...]
+        self.redo_stack = deque(maxlen=UNDO_LIMIT)
 
 state = State()
 
 # ---------- Helpers ----------
-def push_undo():
-    state.undo_stack.append(copy.deepcopy(state.regions))
+def _pack_page_regions(regs):
+    # undo snapshots hold one pickled list of (id, rect, text, tag) per page
+    # instead of live dicts; '_rect_obj' is left out and rebuilt on demand
+    return pickle.dumps([(r['id'], r['rect'], r.get('text', ''), r.get('tag', 'p')) for r in regs],
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+def _unpack_page_regions(blob):
+    return [{'id': sys.intern(rid), 'rect': rect, 'text': text, 'tag': sys.intern(tag)}
+            for rid, rect, text, tag in pickle.loads(blob)]
+
+def _snapshot(page_idx):
+    # page_idx=None snapshots every page (used when a whole document is replaced)
+    if page_idx is None:
+        return (None, {pidx: _pack_page_regions(regs) for pidx, regs in state.regions.items()})
+    return (page_idx, _pack_page_regions(state.regions.get(page_idx, [])))
+
+def _restore(snap):
+    page_idx, packed = snap
+    if page_idx is None:
+        state.regions = {pidx: _unpack_page_regions(blob) for pidx, blob in packed.items()}
+        _clear_region_index()
+    else:
+        state.regions[page_idx] = _unpack_page_regions(packed)
+        state.page_index = page_idx
+
+def push_undo(page_idx=None):
+    state.undo_stack.append(_snapshot(page_idx))
     state.redo_stack.clear()
 
 def do_undo(root, canvas, html_text, listbox):
     if not state.undo_stack:
         messagebox.showinfo('Undo', 'Nothing to undo')
         return
-    state.redo_stack.append(copy.deepcopy(state.regions))
-    state.regions = state.undo_stack.pop()
+    snap = state.undo_stack.pop()
+    state.redo_stack.append(_snapshot(snap[0]))
+    _restore(snap)
     state.selected_region = None
-    render_current_page(root, canvas, html_text, listbox)
+    refresh_overlays_only(root, canvas, html_text, listbox)
 
 def do_redo(root, canvas, html_text, listbox):
     if not state.redo_stack:
         messagebox.showinfo('Redo', 'Nothing to redo')
         return
-    state.undo_stack.append(copy.deepcopy(state.regions))
-    state.regions = state.redo_stack.pop()
+    snap = state.redo_stack.pop()
+    state.undo_stack.append(_snapshot(snap[0]))
+    _restore(snap)
     state.selected_region = None
-    render_current_page(root, canvas, html_text, listbox)
+    refresh_overlays_only(root, canvas, html_text, listbox)
+
+# LRU of rendered pages: {(doc id, page number, zoom): (width, height, ppm bytes)}
+_PIX_CACHE = OrderedDict()
 
 def render_page_image(page, zoom):
+    """
+    Rasterize page at zoom and return (width, height, ppm bytes).
+    PPM is handed straight to tk.PhotoImage, so no PIL copy is needed.
+    """
+    key = (id(state.doc), page.number, round(zoom, 4))
+    img = _PIX_CACHE.get(key)
+    if img is not None:
+        _PIX_CACHE.move_to_end(key)
+        return img
     mat = fitz.Matrix(zoom, zoom)
     pix = page.get_pixmap(matrix=mat, alpha=False)
-    img = Image.frombytes('RGB', [pix.width, pix.height], pix.samples)
+    img = (pix.width, pix.height, pix.tobytes('ppm'))
+    _PIX_CACHE[key] = img
+    if len(_PIX_CACHE) > PIX_CACHE_MAX:
+        _PIX_CACHE.popitem(last=False)
     return img
 
-def page_to_image_coords(px, py, img_w, img_h, page):
-    sx = img_w / page.rect.width
-    sy = img_h / page.rect.height
+def set_image_scale(img_w, img_h, page):
+    state.scale_p2i = (img_w / page.rect.width, img_h / page.rect.height)
+    state.scale_i2p = (page.rect.width / img_w, page.rect.height / img_h)
+
+def page_to_image_coords(px, py):
+    sx, sy = state.scale_p2i
     return px * sx, py * sy
 
-def image_to_page_coords(ix, iy, img_w, img_h, page):
-    sx = page.rect.width / img_w
-    sy = page.rect.height / img_h
+def image_to_page_coords(ix, iy):
+    sx, sy = state.scale_i2p
     return ix * sx, iy * sy
 
 def rect_normalize(r):
@@ -88,8 +151,54 @@ def rect_from_tuple(t):
     x0,y0,x1,y1 = t
     return fitz.Rect(x0,y0,x1,y1)
 
+def region_rect(r):
+    # fitz.Rect built once at region creation and kept under '_rect_obj'
+    # (never exported); regions from older snapshots get it on first use
+    rr = r.get('_rect_obj')
+    if rr is None:
+        rr = r['_rect_obj'] = rect_from_tuple(r['rect'])
+    return rr
+
+# Region ids / tags are interned: they are short, repeated, and compared often
 def generate_region_id(page_idx, idx):
-    return f'p{page_idx+1}_r{idx+1}'
+    return sys.intern(f'p{page_idx+1}_r{idx+1}')
+
+def tagged_region_id(tag, rid):
+    return sys.intern(f"{tag}_{rid}")
+
+def _reindex_page(pidx):
+    regs = state.regions.get(pidx, [])
+    idx_map = {}
+    for i, r in enumerate(regs):
+        idx_map.setdefault(r['id'], i)   # first match wins, same as a linear scan
+    state.id_index[pidx] = idx_map
+
+    entries = sorted((r['rect'][1], r['rect'][3], r['rect'][0], r['rect'][2], i) for i, r in enumerate(regs))
+    max_h = max((e[1] - e[0] for e in entries), default=0)
+    state.region_y_index[pidx] = ([e[0] for e in entries], entries, max_h)
+
+def _clear_region_index():
+    state.id_index.clear()
+    state.region_y_index.clear()
+
+def region_index_by_id(pidx, rid):
+    if pidx not in state.id_index:
+        _reindex_page(pidx)
+    return state.id_index[pidx].get(rid)
+
+def region_index_at(pidx, px, py):
+    """
+    Index of the topmost (last drawn) region on page pidx containing (px, py), or None.
+    Only regions whose y0 lies in [py - tallest region height, py] are checked.
+    """
+    if pidx not in state.region_y_index:
+        _reindex_page(pidx)
+    y0s, entries, max_h = state.region_y_index[pidx]
+    found = None
+    for y0, y1, x0, x1, idx in entries[bisect_left(y0s, py - max_h):bisect_right(y0s, py)]:
+        if py <= y1 and x0 <= px <= x1 and (found is None or idx > found):
+            found = idx
+    return found
 
 # ---------- Expanded Symbol entities (AUTO) ----------
 # This map includes math symbols, Greek letters, and common Latin accented characters.
@@ -149,45 +258,58 @@ HTML_ENTITY_MAP = {
     '‹': '&lsaquo;','›': '&rsaquo;','«': '&laquo;','»': '&raquo;',
 }
 
+# Every key is a single codepoint, so one translate() pass covers the whole map
+_ENTITY_TRANS = str.maketrans(HTML_ENTITY_MAP)
+
 def apply_html_entities(text):
     if not text:
         return text
-    # Simple replace — do longer keys first to avoid partial collision (not usually needed here)
-    for k, v in HTML_ENTITY_MAP.items():
-        text = text.replace(k, v)
-    return text
+    return text.translate(_ENTITY_TRANS)
 
 # ---------- Bold & Italic detection & HTML escaping ----------
 # PyMuPDF span['flags'] bitmask:
 #   bit 1 (2) => italic
 #   bit 4 (16) => bold
 
+_BI_MASK = 2 | 16
+
+# {NESTING_PREF: {flags & _BI_MASK: wrapper}} — picked once per toggle, not per span
+_WRAPPERS = {
+    'b_outside_i': {
+        18: lambda s: f"<b><i>{s}</i></b>",
+        16: lambda s: f"<b>{s}</b>",
+        2: lambda s: f"<i>{s}</i>",
+        0: lambda s: s,
+    },
+    'i_outside_b': {
+        18: lambda s: f"<i><b>{s}</b></i>",
+        16: lambda s: f"<b>{s}</b>",
+        2: lambda s: f"<i>{s}</i>",
+        0: lambda s: s,
+    },
+}
+_active_wrap = _WRAPPERS[NESTING_PREF]
+
 def wrap_span_text(s, is_bold, is_italic):
     """
     Wrap span text according to current nesting preference.
     """
-    if is_bold and is_italic:
-        if NESTING_PREF == 'b_outside_i':
-            return f"<b><i>{s}</i></b>"
-        else:
-            return f"<i><b>{s}</b></i>"
-    elif is_bold:
-        return f"<b>{s}</b>"
-    elif is_italic:
-        return f"<i>{s}</i>"
-    else:
-        return s
+    return _active_wrap[(16 if is_bold else 0) | (2 if is_italic else 0)](s)
 
-def extract_text_from_rect(page, rect):
+def _rects_overlap(r, x0, y0, x1, y1):
+    return r[0] < x1 and r[2] > x0 and r[1] < y1 and r[3] > y0
+
+@functools.lru_cache(maxsize=512)
+def _clip_spans(page_number, rect):
     """
-    Extract text inside rect from page; wrap spans with <i>, <b> in the chosen nesting order.
+    get_text('dict', clip=rect) reduced to [[(flags, text), ...], ...], one list per line.
+    Cached per (page, rect) so a rect is only clipped once, whatever the nesting preference.
     """
-    txt_parts = []
-    d = page.get_text('dict', clip=rect)
-    blocks = d.get('blocks', [])
-    for b in blocks:
+    d = state.doc[page_number].get_text('dict', clip=fitz.Rect(*rect))
+    lines = []
+    for b in d.get('blocks', []):
         for line in b.get('lines', []):
-            line_parts = []
+            spans = []
             for span in line.get('spans', []):
                 s = span.get('text', '')
                 if not s:
@@ -195,15 +317,42 @@ def extract_text_from_rect(page, rect):
                 s = s.replace('\n', ' ').strip()
                 if not s:
                     continue
-                flags = int(span.get('flags', 0))
-                is_italic = bool(flags & 2)
-                is_bold = bool(flags & 16)
-                wrapped = wrap_span_text(s, is_bold, is_italic)
-                line_parts.append(wrapped)
-            if line_parts:
-                txt_parts.append(" ".join(line_parts))
+                spans.append((int(span.get('flags', 0)), s))
+            if spans:
+                lines.append(spans)
+    return lines
+
+def extract_text_from_rect(page, rect):
+    """
+    Extract text inside rect from page; wrap spans with <i>, <b> in the chosen nesting order.
+    """
+    wrap = _active_wrap
+    txt_parts = [" ".join(wrap[flags & _BI_MASK](s) for flags, s in spans)
+                 for spans in _clip_spans(page.number, tuple(rect))]
     return "\n".join(txt_parts).strip()
 
+@functools.lru_cache(maxsize=512)
+def _extract_cached(page_number, rect, nesting_pref):
+    # nesting_pref is only part of the cache key: the wrapped output depends on it
+    return extract_text_from_rect(state.doc[page_number], fitz.Rect(*rect))
+
+_ENTITY_TAIL = r'(?:#\d+;|#x[0-9a-fA-F]+;|[a-zA-Z][a-zA-Z0-9]+;)'
+# One alternation, tried left to right: nested b/i, single b, single i, then bare &,<,>
+_TOKEN_RE = re.compile(
+    r'<b>\s*<i>(?P<bi>.*?)</i>\s*</b>'
+    r'|<i>\s*<b>(?P<ib>.*?)</b>\s*</i>'
+    r'|<b>(?P<b>.*?)</b>'
+    r'|<i>(?P<i>.*?)</i>'
+    r'|(?P<ent>&' + _ENTITY_TAIL + ')'
+    r'|(?P<amp>&)|(?P<lt><)|(?P<gt>>)',
+    re.S | re.I)
+# Bare &,<,> inside a protected <b>/<i> body
+_INNER_RE = re.compile(r'&(?!' + _ENTITY_TAIL + ')|<|>')
+_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+
+def _escape_inner(s):
+    return _INNER_RE.sub(lambda m: _ESCAPES[m.group(0)], s)
+
 def escape_html_keep_bi_and_entities(text):
     """
     Escape text for HTML preview while preserving <b>/<i> tags and valid entities.
@@ -211,57 +360,40 @@ def escape_html_keep_bi_and_entities(text):
     if not text:
         return ''
 
-    # placeholders
-    ph_b_open = "@@B_OPEN@@"
-    ph_b_close = "@@B_CLOSE@@"
-    ph_i_open = "@@I_OPEN@@"
-    ph_i_close = "@@I_CLOSE@@"
-
-    # protect nested <b><i>...</i></b> or <i><b>...</b></i>
-    def protect_nested(m):
-        inner = m.group(1)
-        inner_escaped = inner.replace('<', '&lt;').replace('>', '&gt;')
-        # detect actual nesting sequence to restore later exactly as found
-        seq = m.group(0)
-        if seq.lower().startswith('<b>'):
-            return ph_b_open + ph_i_open + inner_escaped + ph_i_close + ph_b_close
+    parts = []
+    pos = 0
+    for m in _TOKEN_RE.finditer(text):
+        parts.append(text[pos:m.start()])
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'bi':
+            parts.append('<b><i>' + _escape_inner(m.group('bi')) + '</i></b>')
+        elif kind == 'ib':
+            parts.append('<i><b>' + _escape_inner(m.group('ib')) + '</b></i>')
+        elif kind == 'b':
+            parts.append('<b>' + _escape_inner(m.group('b')) + '</b>')
+        elif kind == 'i':
+            parts.append('<i>' + _escape_inner(m.group('i')) + '</i>')
+        elif kind == 'ent':
+            parts.append(m.group(0))
         else:
-            return ph_i_open + ph_b_open + inner_escaped + ph_b_close + ph_i_close
-
-    text_prot = re.sub(r'<b>\s*<i>(.*?)</i>\s*</b>', protect_nested, text, flags=re.S|re.I)
-    text_prot = re.sub(r'<i>\s*<b>(.*?)</b>\s*</i>', protect_nested, text_prot, flags=re.S|re.I)
-
-    # Protect <b>...</b>
-    def protect_b(m):
-        inner = m.group(1)
-        inner_escaped = inner.replace('<', '&lt;').replace('>', '&gt;')
-        return ph_b_open + inner_escaped + ph_b_close
-    text_prot = re.sub(r'<b>(.*?)</b>', protect_b, text_prot, flags=re.S|re.I)
-
-    # Protect <i>...</i>
-    def protect_i(m):
-        inner = m.group(1)
-        inner_escaped = inner.replace('<', '&lt;').replace('>', '&gt;')
-        return ph_i_open + inner_escaped + ph_i_close
-    text_prot = re.sub(r'<i>(.*?)</i>', protect_i, text_prot, flags=re.S|re.I)
-
-    # Escape leftover angle brackets
-    text_prot = text_prot.replace('<', '&lt;').replace('>', '&gt;')
-
-    # Escape '&' that are NOT part of a valid entity (named or numeric)
-    def amp_repl(m):
-        idx = m.start()
-        following = text_prot[idx+1:idx+1+30]
-        if re.match(r'(#\d+;|#x[0-9a-fA-F]+;|[a-zA-Z][a-zA-Z0-9]+;)', following):
-            return '&'
-        return '&amp;'
-    text_prot = re.sub(r'&', lambda m: amp_repl(m), text_prot)
-
-    # Restore placeholders
-    text_prot = text_prot.replace(ph_b_open, '<b>').replace(ph_b_close, '</b>')
-    text_prot = text_prot.replace(ph_i_open, '<i>').replace(ph_i_close, '</i>')
-
-    return text_prot
+            parts.append(_ESCAPES[m.group(0)])
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+# entities (when on) and &,<,> escapes fused into one table, keyed by AUTO_ENTITIES
+_PLAIN_TRANS = {True: str.maketrans({**HTML_ENTITY_MAP, **_ESCAPES}), False: str.maketrans(_ESCAPES)}
+
+def escape_plain_text(text, entities):
+    """
+    apply_html_entities + escape_html_keep_bi_and_entities in one translate pass.
+    Text with '&' or '<' may carry entities or <b>/<i> to keep, so it takes the two-pass path.
+    """
+    if '&' in text or '<' in text:
+        if entities:
+            text = apply_html_entities(text)
+        return escape_html_keep_bi_and_entities(text)
+    return text.translate(_PLAIN_TRANS[entities])
 
 # ---------- Build nested sections helper ----------
 def build_nested_sections_from_regions(regs, page_index, page):
@@ -277,20 +409,16 @@ def build_nested_sections_from_regions(regs, page_index, page):
     """
     level_map = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4}
     counters = [0, 0, 0, 0, 0]  # index by level
-    open_stack = []  # stack of opened section levels
-    out = []
-
-    def close_to_level(target_level):
-        nonlocal open_stack, out
-        while open_stack and open_stack[-1] >= target_level:
-            out.append('</section>')
-            open_stack.pop()
-
-    base_opened = False
+    page_id = str(page_index + 1)
+    if not regs:
+        return ''
+    # the page-level section is opened by the first region; sentinel level 0
+    out = [f'<section id="{page_id}">']
+    open_stack = [0]  # stack of opened section levels
 
     for r in regs:
         tag = (r.get('tag') or 'p').lower()
-        text = r.get('text') or extract_text_from_rect(page, fitz.Rect(*r['rect']))
+        text = r.get('text') or _extract_cached(page.number, tuple(r['rect']), NESTING_PREF)
         if AUTO_ENTITIES:
             text = apply_html_entities(text)
         text_esc = escape_html_keep_bi_and_entities(text)
@@ -302,41 +430,28 @@ def build_nested_sections_from_regions(regs, page_index, page):
             for lower in range(lvl+1, 5):
                 counters[lower] = 0
 
-            # ensure base section open
-            if not base_opened:
-                top_id = str(page_index + 1)
-                out.append(f'<section id="{top_id}">')
-                open_stack.append(0)  # sentinel (0) for page-level
-                base_opened = True
-
             # close any sections that are at >= this level
-            close_to_level(lvl)
+            keep = len(open_stack)
+            while keep and open_stack[keep-1] >= lvl:
+                keep -= 1
+            out.extend(['</section>'] * (len(open_stack) - keep))
+            del open_stack[keep:]
 
             # new section id using counters up to this level
-            nums = [str(page_index + 1)]
-            for i in range(1, lvl+1):
-                nums.append(str(counters[i]))
-            sec_id = ".".join(nums)
+            sec_id = ".".join([page_id] + [str(c) for c in counters[1:lvl+1]])
 
             out.append(f'<section id="{sec_id}">')
             open_stack.append(lvl)
 
             # add the heading inside
-            out.append(f'<{tag} id="{r["id"]}">{text_esc}</{tag}>' )
+            out.append(f'<{tag} id="{r["id"]}">{text_esc}</{tag}>')
         else:
-            # normal content — open base if needed
-            if not base_opened:
-                top_id = str(page_index + 1)
-                out.append(f'<section id="{top_id}">')
-                open_stack.append(0)
-                base_opened = True
+            # normal content goes into the current open section
             safe_id = r.get('id','')
             out.append(f'<{tag} id="{safe_id}">{text_esc}</{tag}>')
 
     # close all opened sections
-    while open_stack:
-        out.append('</section>')
-        open_stack.pop()
+    out.extend(['</section>'] * len(open_stack))
 
     return "\n".join(out)
 
@@ -353,39 +468,82 @@ def open_pdf(root, canvas, html_text, listbox):
     state.page_index = 0
     state.regions = {}
     state.undo_stack.clear(); state.redo_stack.clear()
+    _clear_region_index()
+    _PIX_CACHE.clear()
+    _extract_cached.cache_clear()
+    _clip_spans.cache_clear()
+    _page_word_boxes.cache_clear()
+    _page_span_sizes.cache_clear()
     render_current_page(root, canvas, html_text, listbox)
 
 def render_current_page(root, canvas, html_text, listbox):
     canvas.delete('all')
     listbox.delete(0, tk.END)
-    html_text.config(state='normal')
-    html_text.delete('1.0', tk.END)
+    state.rendered_page = None
+    state.region_canvas_ids = []
 
     if not state.doc:
-        html_text.insert(tk.END, '<!-- Open a PDF -->')
+        html_text.config(state='normal')
+        html_text.replace('1.0', tk.END, '<!-- Open a PDF -->')
         html_text.config(state='disabled')
         return
+    # the preview keeps its old content, read-only, until _apply_html replaces it
+
+    _render_pdf_pixmap(canvas)
+    _render_overlays(root, canvas, html_text, listbox)
+
+def refresh_overlays_only(root, canvas, html_text, listbox):
+    """
+    Redraw region boxes, listbox and HTML preview over the page image already on
+    the canvas. Falls back to a full render if the current page isn't displayed.
+    """
+    if not state.doc or state.rendered_page != state.page_index:
+        render_current_page(root, canvas, html_text, listbox)
+        return
+    _render_overlays(root, canvas, html_text, listbox)
 
+def _render_pdf_pixmap(canvas):
     page = state.doc[state.page_index]
     target_w = 430
     zoom = target_w / page.rect.width if page.rect.width>0 else 1.0
     state.zoom = zoom
-    pil = render_page_image(page, zoom)
-    state.img_holder['pil'] = pil
-    state.img_holder['tk'] = ImageTk.PhotoImage(pil)
-    canvas.config(width=pil.width, height=pil.height)
+    img_w, img_h, ppm = render_page_image(page, zoom)
+    state.img_holder['size'] = (img_w, img_h)
+    set_image_scale(img_w, img_h, page)
+    state.img_holder['tk'] = tk.PhotoImage(data=ppm)
+    canvas.config(width=img_w, height=img_h)
     canvas.create_image(0,0,anchor='nw',image=state.img_holder['tk'],tags='pdfimg')
+    state.rendered_page = state.page_index
 
+def _render_overlays(root, canvas, html_text, listbox):
+    canvas.delete('hl')
+    listbox.delete(0, tk.END)
+
+    sx, sy = state.scale_p2i
+    ids = state.region_canvas_ids
     regs = state.regions.get(state.page_index, [])
+    _reindex_page(state.page_index)
     for idx, r in enumerate(regs):
         x0,y0,x1,y1 = r['rect']
-        x0_i, y0_i = page_to_image_coords(x0, y0, pil.width, pil.height, page)
-        x1_i, y1_i = page_to_image_coords(x1, y1, pil.width, pil.height, page)
-        canvas.create_rectangle(x0_i, y0_i, x1_i, y1_i, outline='red', width=2, tags=(f'reg_{idx}', 'region'))
+        x0_i, y0_i = x0 * sx, y0 * sy
+        x1_i, y1_i = x1 * sx, y1 * sy
         icon_x = max(2, x0_i + 4)
         icon_y = max(2, y0_i + 4)
-        canvas.create_text(icon_x, icon_y, text=(r.get('tag','p') or 'p'), anchor='nw', font=('Helvetica',10,'bold'), tags=(f'icon_{idx}',))
+        label = r.get('tag','p') or 'p'
+        # reuse the canvas items already drawn for this slot; only create new ones
+        if idx < len(ids):
+            rect_id, text_id = ids[idx]
+            canvas.coords(rect_id, x0_i, y0_i, x1_i, y1_i)
+            canvas.coords(text_id, icon_x, icon_y)
+            canvas.itemconfig(text_id, text=label)
+        else:
+            rect_id = canvas.create_rectangle(x0_i, y0_i, x1_i, y1_i, outline='red', width=2, tags=(f'reg_{idx}', 'region'))
+            text_id = canvas.create_text(icon_x, icon_y, text=label, anchor='nw', font=('Helvetica',10,'bold'), tags=(f'icon_{idx}', 'icon'))
+            ids.append((rect_id, text_id))
         listbox.insert(tk.END, f"{r['id']} [{r.get('tag','p')}]  ({int(y0)}-{int(y1)})")
+    for rect_id, text_id in ids[len(regs):]:
+        canvas.delete(rect_id, text_id)
+    del ids[len(regs):]
 
     # Update HTML preview using nested sections
     update_html_from_regions(html_text)
@@ -422,22 +580,22 @@ def canvas_mouse_up(event, canvas, html_text, listbox):
     if not state.doc:
         return
     page = state.doc[state.page_index]
-    img_w, img_h = state.img_holder['pil'].size
-    px0, py0 = image_to_page_coords(x0, y0, img_w, img_h, page)
-    px1, py1 = image_to_page_coords(x1, y1, img_w, img_h, page)
+    px0, py0 = image_to_page_coords(x0, y0)
+    px1, py1 = image_to_page_coords(x1, y1)
     rect = rect_normalize((px0, py0, px1, py1))
     if abs(rect[2]-rect[0]) < 2 or abs(rect[3]-rect[1]) < 2:
         return
-    push_undo()
+    push_undo(state.page_index)
     regs = state.regions.setdefault(state.page_index, [])
     rid = generate_region_id(state.page_index, len(regs))
-    raw_text = extract_text_from_rect(page, rect_from_tuple(rect))
+    rect_obj = rect_from_tuple(rect)
+    raw_text = extract_text_from_rect(page, rect_obj)
     # AUTO: apply symbol entities to extracted text if enabled
     if AUTO_ENTITIES:
         raw_text = apply_html_entities(raw_text)
-    rdict = {'id': rid, 'rect': rect, 'text': raw_text, 'tag': 'p'}
+    rdict = {'id': rid, 'rect': rect, 'text': raw_text, 'tag': 'p', '_rect_obj': rect_obj}
     regs.append(rdict)
-    render_current_page(root, canvas, html_text, listbox)
+    refresh_overlays_only(root, canvas, html_text, listbox)
 
 def listbox_select(event, canvas, html_text):
     sel = event.widget.curselection()
@@ -455,27 +613,17 @@ def highlight_region_in_canvas(canvas, idx):
     regs = state.regions.get(state.page_index, [])
     if not (0 <= idx < len(regs)):
         return
-    page = state.doc[state.page_index]
-    pil = state.img_holder['pil']
     r = regs[idx]
     x0,y0,x1,y1 = r['rect']
-    x0_i, y0_i = page_to_image_coords(x0, y0, pil.width, pil.height, page)
-    x1_i, y1_i = page_to_image_coords(x1, y1, pil.width, pil.height, page)
+    x0_i, y0_i = page_to_image_coords(x0, y0)
+    x1_i, y1_i = page_to_image_coords(x1, y1)
     canvas.create_rectangle(x0_i, y0_i, x1_i, y1_i, outline='blue', width=3, tags=('hl',))
 
 def canvas_right_click(event, canvas, listbox, html_text):
     if not state.doc:
         return
-    page = state.doc[state.page_index]
-    img_w, img_h = state.img_holder['pil'].size
-    px, py = image_to_page_coords(event.x, event.y, img_w, img_h, page)
-    regs = state.regions.get(state.page_index, [])
-    found_idx = None
-    for idx in range(len(regs)-1, -1, -1):
-        x0,y0,x1,y1 = regs[idx]['rect']
-        if x0 <= px <= x1 and y0 <= py <= y1:
-            found_idx = idx
-            break
+    px, py = image_to_page_coords(event.x, event.y)
+    found_idx = region_index_at(state.page_index, px, py)
     if found_idx is not None:
         state.selected_region = (state.page_index, found_idx)
         try:
@@ -497,19 +645,77 @@ def canvas_right_click(event, canvas, listbox, html_text):
 
 # ---------- HTML sync & splitting ----------
 def update_html_from_regions(html_text):
-    html_text.config(state='normal')
-    html_text.delete('1.0', tk.END)
-    if not state.doc:
-        html_text.insert(tk.END, '<!-- Open a PDF -->')
-        html_text.config(state='disabled')
+    # Bursts of region edits (drag, tag keys, undo) collapse into one rebuild
+    if state.html_after is not None:
+        root.after_cancel(state.html_after)
+    state.html_after = root.after(HTML_DEBOUNCE_MS, _do_update_html, html_text)
+
+def flush_html_update(html_text):
+    # Bring the preview up to date now, for callers that read the preview next
+    if state.html_after is not None:
+        root.after_cancel(state.html_after)
+        state.html_after = None
+    elif state.html_shown_gen == state.html_gen:
         return
-    page = state.doc[state.page_index]
+    state.html_gen += 1
+    job = _html_job()
+    fragment = build_nested_sections_from_regions(*job) if isinstance(job, tuple) else job
+    _apply_html(html_text, state.html_gen, fragment)
+
+# one worker: builds are serial, and html_gen discards any that went stale
+_HTML_EXEC = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+# finished builds as (html_text, gen, future); only the Tk thread takes them out
+_HTML_RESULTS = queue.Queue()
+
+def _html_job():
+    # Placeholder string, or the args for build_nested_sections_from_regions.
+    # Region texts are resolved here on the UI thread so the worker never
+    # touches the fitz document; it only runs the entity/escape/section build.
+    if not state.doc:
+        return '<!-- Open a PDF -->'
     regs = state.regions.get(state.page_index, [])
-    if regs:
-        html_fragment = build_nested_sections_from_regions(regs, state.page_index, page)
-    else:
-        html_fragment = '<!-- No regions on this page -->'
-    html_text.insert(tk.END, html_fragment)
+    if not regs:
+        return '<!-- No regions on this page -->'
+    page = state.doc[state.page_index]
+    snap = [dict(r, text=r.get('text') or _extract_cached(page.number, tuple(r['rect']), NESTING_PREF))
+            for r in regs]
+    return (snap, state.page_index, page)
+
+def _do_update_html(html_text):
+    state.html_after = None
+    state.html_gen += 1
+    gen = state.html_gen
+    job = _html_job()
+    if not isinstance(job, tuple):
+        _apply_html(html_text, gen, job)
+        return
+    fut = _HTML_EXEC.submit(build_nested_sections_from_regions, *job)
+    # the callback runs on the worker, so it only queues the build; _poll_html
+    # calls result() on the Tk thread, where build errors surface
+    fut.add_done_callback(lambda f: _HTML_RESULTS.put((html_text, gen, f)))
+    state.html_pending += 1
+    if state.html_pending == 1:
+        root.after(HTML_POLL_MS, _poll_html)
+
+def _poll_html():
+    try:
+        while True:
+            try:
+                html_text, gen, fut = _HTML_RESULTS.get_nowait()
+            except queue.Empty:
+                break
+            state.html_pending -= 1
+            _apply_html(html_text, gen, fut.result())
+    finally:
+        if state.html_pending:
+            root.after(HTML_POLL_MS, _poll_html)
+
+def _apply_html(html_text, gen, fragment):
+    if gen != state.html_gen:
+        return
+    state.html_shown_gen = gen
+    html_text.config(state='normal')
+    html_text.replace('1.0', tk.END, fragment)
     html_text.config(state='disabled')
 
 def highlight_region_in_html(html_text, page_idx, idx):
@@ -541,13 +747,12 @@ def sync_html_to_pdf(html_text, canvas):
     txt = html_text.get('1.0', tk.END)
     for m in re.finditer(r"<([a-z0-9]+)[^>]*\bid\s*=\s*['\"]([^'\"]+)['\"][^>]*>", txt, flags=re.I|re.S):
         pid = m.group(2)
-        regs = state.regions.get(state.page_index, [])
-        for idx, r in enumerate(regs):
-            if r['id'] == pid:
-                state.selected_region = (state.page_index, idx)
-                highlight_region_in_canvas(canvas, idx)
-                highlight_region_in_html_by_id(html_text, state.page_index, idx)
-                return
+        idx = region_index_by_id(state.page_index, pid)
+        if idx is not None:
+            state.selected_region = (state.page_index, idx)
+            highlight_region_in_canvas(canvas, idx)
+            highlight_region_in_html_by_id(html_text, state.page_index, idx)
+            return
     messagebox.showinfo('Sync', 'Could not find a matching region id on this page.')
 
 def split_region_at_html_cursor(html_text, canvas, listbox):
@@ -563,55 +768,53 @@ def split_region_at_html_cursor(html_text, canvas, listbox):
             rel = abs_offset - (s + m.group(0).find('>') + 1)
             rel = max(0, min(len(inner_plain), rel))
             regs = state.regions.get(state.page_index, [])
-            for idx, r in enumerate(regs):
-                if r['id'] == pid:
-                    rect = r['rect']
-                    total = len(inner_plain) if len(inner_plain) > 0 else 1
-                    ratio = rel / total
-                    y0 = rect[1]; y1 = rect[3]
-                    split_y = y0 + (y1 - y0) * ratio
-                    push_undo()
-                    r1 = (rect[0], rect[1], rect[2], split_y)
-                    r2 = (rect[0], split_y, rect[2], rect[3])
-                    regs.pop(idx)
-                    regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r2, 'text': '', 'tag': r.get('tag','p')})
-                    regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r1, 'text': '', 'tag': r.get('tag','p')})
-                    render_current_page(root, canvas, html_text, listbox)
-                    return
+            idx = region_index_by_id(state.page_index, pid)
+            if idx is not None:
+                r = regs[idx]
+                rect = r['rect']
+                total = len(inner_plain) if len(inner_plain) > 0 else 1
+                ratio = rel / total
+                y0 = rect[1]; y1 = rect[3]
+                split_y = y0 + (y1 - y0) * ratio
+                push_undo(state.page_index)
+                r1 = (rect[0], rect[1], rect[2], split_y)
+                r2 = (rect[0], split_y, rect[2], rect[3])
+                regs.pop(idx)
+                regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r2, 'text': '', 'tag': r.get('tag','p'), '_rect_obj': rect_from_tuple(r2)})
+                regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r1, 'text': '', 'tag': r.get('tag','p'), '_rect_obj': rect_from_tuple(r1)})
+                refresh_overlays_only(root, canvas, html_text, listbox)
+                return
     messagebox.showinfo('Split', 'Could not find a paragraph containing the cursor.')
 
 # ---------- Word-level click split ----------
+@functools.lru_cache(maxsize=16)
+def _page_word_boxes(page_number):
+    # [(x0, y0, x1, y1, cx, cy), ...] for every word on the page
+    return [(w[0], w[1], w[2], w[3], (w[0] + w[2]) / 2, (w[1] + w[3]) / 2)
+            for w in state.doc[page_number].get_text('words')]
+
 def canvas_click_word(event, canvas, html_text, listbox):
     if not state.doc:
         return
-    page = state.doc[state.page_index]
-    img_w, img_h = state.img_holder['pil'].size
-    px, py = image_to_page_coords(event.x, event.y, img_w, img_h, page)
-    words = page.get_text('words')
-    nearest = None
-    min_d = 1e9
-    for w in words:
-        wx0, wy0, wx1, wy1 = w[0], w[1], w[2], w[3]
-        if wx0 <= px <= wx1 and wy0 <= py <= wy1:
-            nearest = w; break
-        cx = (wx0 + wx1) / 2; cy = (wy0 + wy1) / 2
-        d = (cx - px)**2 + (cy - py)**2
-        if d < min_d:
-            min_d = d; nearest = w
-    if not nearest:
+    px, py = image_to_page_coords(event.x, event.y)
+    words = _page_word_boxes(state.page_index)
+    if not words:
         return
+    nearest = next((w for w in words if w[0] <= px <= w[2] and w[1] <= py <= w[3]), None)
+    if nearest is None:
+        nearest = min(words, key=lambda w: (w[4] - px)**2 + (w[5] - py)**2)
     split_y = nearest[3]
     regs = state.regions.get(state.page_index, [])
     for idx, r in enumerate(regs):
         x0,y0,x1,y1 = r['rect']
         if x0 <= px <= x1 and y0 <= split_y <= y1:
-            push_undo()
+            push_undo(state.page_index)
             r1 = (x0, y0, x1, split_y)
             r2 = (x0, split_y, x1, y1)
             regs.pop(idx)
-            regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r2, 'text': '', 'tag': r.get('tag','p')})
-            regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r1, 'text': '', 'tag': r.get('tag','p')})
-            render_current_page(root, canvas, html_text, listbox)
+            regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r2, 'text': '', 'tag': r.get('tag','p'), '_rect_obj': rect_from_tuple(r2)})
+            regs.insert(idx, {'id': generate_region_id(state.page_index, len(regs)), 'rect': r1, 'text': '', 'tag': r.get('tag','p'), '_rect_obj': rect_from_tuple(r1)})
+            refresh_overlays_only(root, canvas, html_text, listbox)
             return
 
 # ---------- Tagging ----------
@@ -624,11 +827,11 @@ def set_tag_for_selected(tag, canvas, html_text, listbox):
     regs = state.regions.get(pidx, [])
     if not (0 <= idx < len(regs)):
         return
-    push_undo()
-    regs[idx]['tag'] = tag
+    push_undo(pidx)
+    regs[idx]['tag'] = sys.intern(tag)
     # update id to include tag prefix
-    regs[idx]['id'] = f"{tag}_{regs[idx]['id']}"
-    render_current_page(root, canvas, html_text, listbox)
+    regs[idx]['id'] = tagged_region_id(tag, regs[idx]['id'])
+    refresh_overlays_only(root, canvas, html_text, listbox)
 
 def key_tag_handler(event, canvas, html_text, listbox):
     key = event.keysym.lower()
@@ -643,11 +846,11 @@ def key_tag_handler(event, canvas, html_text, listbox):
     regs = state.regions.get(page_idx, [])
     if not (0 <= reg_idx < len(regs)):
         return
-    push_undo()
+    push_undo(page_idx)
     reg = regs[reg_idx]
     old_id = reg['id']
     reg['tag'] = new_tag
-    reg['id'] = f"{new_tag}_{old_id}"
+    reg['id'] = tagged_region_id(new_tag, old_id)
     # update preview HTML fragment if present
     html = html_text.get('1.0', 'end-1c')
     id_pat = re.compile(rf"(<([a-z0-9]+)([^>]*)\bid\s*=\s*(['\"])"+re.escape(old_id)+r"\4([^>]*)>)(.*?)(</\2\s*>)", flags=re.S|re.I)
@@ -661,23 +864,21 @@ def key_tag_handler(event, canvas, html_text, listbox):
         new_fragment = new_open + inner_html + new_close
         new_html = html[:m.start()] + new_fragment + html[m.end():]
         html_text.config(state='normal')
-        html_text.delete('1.0', 'end')
-        html_text.insert('1.0', new_html)
+        html_text.replace('1.0', 'end', new_html)
         html_text.config(state='disabled')
-    render_current_page(root, canvas, html_text, listbox)
-    regs_now = state.regions.get(page_idx, [])
-    for i, r in enumerate(regs_now):
-        if r['id'] == reg['id']:
-            state.selected_region = (page_idx, i)
-            try:
-                listbox.selection_clear(0, tk.END)
-                listbox.selection_set(i)
-                listbox.see(i)
-            except Exception:
-                pass
-            highlight_region_in_canvas(canvas, i)
-            highlight_region_in_html_by_id(html_text, page_idx, i)
-            break
+    refresh_overlays_only(root, canvas, html_text, listbox)
+    flush_html_update(html_text)
+    i = region_index_by_id(page_idx, reg['id'])
+    if i is not None:
+        state.selected_region = (page_idx, i)
+        try:
+            listbox.selection_clear(0, tk.END)
+            listbox.selection_set(i)
+            listbox.see(i)
+        except Exception:
+            pass
+        highlight_region_in_canvas(canvas, i)
+        highlight_region_in_html_by_id(html_text, page_idx, i)
 
 # ---------- Auto-detect ----------
 def auto_detect(page_idx, canvas, html_text, listbox):
@@ -687,10 +888,11 @@ def auto_detect(page_idx, canvas, html_text, listbox):
     blocks = page.get_text('blocks')
     blocks.sort(key=lambda b: b[1])
     regs_calc = []
-    gaps = []
-    for i in range(1, len(blocks)):
-        gaps.append(blocks[i][1] - blocks[i-1][3])
-    median_gap = sorted([g for g in gaps if g>=0] + [0])[len(gaps)//2] if gaps else 0
+    gaps = [b[1] - prev[3] for prev, b in zip(blocks, blocks[1:])]
+    # same pick as before (index len(gaps)//2 of the non-negative gaps plus a 0),
+    # clamped: with many overlapping blocks that index ran past the list
+    pos_gaps = sorted([g for g in gaps if g >= 0] + [0])
+    median_gap = pos_gaps[min(len(gaps) // 2, len(pos_gaps) - 1)] if gaps else 0
     threshold = max(5, median_gap * 1.5)
     cur_x0, cur_y0, cur_x1, cur_y1 = None, None, None, None
     for b in blocks:
@@ -710,15 +912,16 @@ def auto_detect(page_idx, canvas, html_text, listbox):
         regs_calc.append((cur_x0, cur_y0, cur_x1, cur_y1))
 
     if regs_calc:
-        push_undo()
+        push_undo(page_idx)
     page_regs = state.regions.setdefault(page_idx, [])
     for rr in regs_calc:
         rid = generate_region_id(page_idx, len(page_regs))
-        text = extract_text_from_rect(page, fitz.Rect(*rr))
+        rect_obj = rect_from_tuple(rr)
+        text = extract_text_from_rect(page, rect_obj)
         if AUTO_ENTITIES:
             text = apply_html_entities(text)  # AUTO entities
-        page_regs.append({'id': rid, 'rect': rr, 'text': text, 'tag': 'p'})
-    render_current_page(root, canvas, html_text, listbox)
+        page_regs.append({'id': rid, 'rect': rr, 'text': text, 'tag': 'p', '_rect_obj': rect_obj})
+    refresh_overlays_only(root, canvas, html_text, listbox)
 
 # ---------- JSON export/import ----------
 def export_json():
@@ -752,10 +955,12 @@ def import_json(root, canvas, html_text, listbox):
             text = r.get('text','')
             if AUTO_ENTITIES:
                 text = apply_html_entities(text)
-            new_regs[pidx].append({'id': r['id'], 'rect': tuple(r['rect']), 'text': text, 'tag': r.get('tag','p')})
+            rect = tuple(r['rect'])
+            new_regs[pidx].append({'id': sys.intern(r['id']), 'rect': rect, 'text': text, 'tag': sys.intern(r.get('tag','p')), '_rect_obj': rect_from_tuple(rect)})
     push_undo()
     state.regions = new_regs
-    render_current_page(root, canvas, html_text, listbox)
+    _clear_region_index()
+    refresh_overlays_only(root, canvas, html_text, listbox)
 
 def delete_region(listbox, canvas, html_text):
     sel = listbox.curselection()
@@ -765,9 +970,9 @@ def delete_region(listbox, canvas, html_text):
     idx = sel[0]
     regs = state.regions.get(state.page_index, [])
     if 0 <= idx < len(regs):
-        push_undo()
+        push_undo(state.page_index)
         regs.pop(idx)
-        render_current_page(root, canvas, html_text, listbox)
+        refresh_overlays_only(root, canvas, html_text, listbox)
 
 # ---------- Navigation ----------
 def prev_page(root, canvas, html_text, listbox):
@@ -799,6 +1004,23 @@ def save_html_to_file(html_text):
     messagebox.showinfo('Saved', f'HTML saved to {path}')
 
 # ---------- Save ALL pages (wrapped) - uses nested sections ----------
+_ALL_PAGES_HEAD = "<!doctype html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<style>\n.pdf-page { page-break-after: always; margin: 20px 0; }\nbody { font-family: sans-serif; }\n</style>\n</head>\n<body>\n"
+_ALL_PAGES_TAIL = "\n</body>\n</html>"
+
+def _iter_page_fragments():
+    # one HTML fragment per page: its regions, or the full page text if it has none
+    for pidx in range(len(state.doc)):
+        page = state.doc[pidx]
+        regs = state.regions.get(pidx, [])
+        if regs:
+            yield build_nested_sections_from_regions(regs, pidx, page)
+            continue
+        # fallback — full page text (wrapped in a top-level section)
+        full_esc = escape_plain_text(page.get_text(), AUTO_ENTITIES)
+        paras = [p.strip() for p in full_esc.split('\n\n') if p.strip()]
+        frag_parts = [f'<p>{para}</p>' for para in paras] if paras else [f'<p>{full_esc}</p>']
+        yield f'<section id="{pidx+1}">\n<h2>Page {pidx+1}</h2>\n' + "\n".join(frag_parts) + "\n</section>"
+
 def save_all_pages_html(html_text):
     """
     Save a single HTML file that contains the extracted/annotated HTML for every page,
@@ -811,32 +1033,25 @@ def save_all_pages_html(html_text):
     if not path:
         return
 
-    parts = []
-    total_pages = len(state.doc)
-    for pidx in range(total_pages):
-        page = state.doc[pidx]
-        regs = state.regions.get(pidx, [])
-        if regs:
-            page_fragment = build_nested_sections_from_regions(regs, pidx, page)
-        else:
-            # fallback — full page text (wrapped in a top-level section)
-            full = page.get_text()
-            if AUTO_ENTITIES:
-                full = apply_html_entities(full)
-            full_esc = escape_html_keep_bi_and_entities(full)
-            paras = [p.strip() for p in full_esc.split('\n\n') if p.strip()]
-            frag_parts = [f'<p>{para}</p>' for para in paras] if paras else [f'<p>{full_esc}</p>']
-            page_fragment = f'<section id="{pidx+1}">\n<h2>Page {pidx+1}</h2>\n' + "\n".join(frag_parts) + "\n</section>"
-
-        parts.append(page_fragment)
-
-    wrapped = "<!doctype html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<style>\n.pdf-page { page-break-after: always; margin: 20px 0; }\nbody { font-family: sans-serif; }\n</style>\n</head>\n<body>\n" + "\n<hr/>\n".join(parts) + "\n</body>\n</html>"
-
+    # written page by page, so only one page's HTML is held at a time
     with open(path, 'w', encoding='utf-8') as f:
-        f.write(wrapped)
+        f.write(_ALL_PAGES_HEAD)
+        for pidx, page_fragment in enumerate(_iter_page_fragments()):
+            if pidx:
+                f.write("\n<hr/>\n")
+            f.write(page_fragment)
+        f.write(_ALL_PAGES_TAIL)
     messagebox.showinfo('Saved', f'All pages saved to {path}')
 
 # ---------- Infer headings by font size ----------
+@functools.lru_cache(maxsize=16)
+def _page_span_sizes(page_number):
+    # [(span bbox, font size), ...] for every sized span on the page
+    d = state.doc[page_number].get_text('dict')
+    return [(tuple(span['bbox']), float(span['size']))
+            for b in d.get('blocks', []) for line in b.get('lines', [])
+            for span in line.get('spans', []) if span.get('size', 0)]
+
 def infer_headings_for_page(root, canvas, html_text, listbox):
     """
     For each region on current page, compute average span font size inside its rect.
@@ -856,21 +1071,13 @@ def infer_headings_for_page(root, canvas, html_text, listbox):
         messagebox.showinfo('Info', 'No regions on this page to infer headings for.')
         return
 
-    # compute average font size per region
+    # compute average font size per region, from one parse of the page
+    spans = _page_span_sizes(page.number)
     sizes = []
     for r in regs:
-        rect = fitz.Rect(*r['rect'])
-        d = page.get_text('dict', clip=rect)
-        total_sz = 0.0
-        count = 0
-        for b in d.get('blocks', []):
-            for line in b.get('lines', []):
-                for span in line.get('spans', []):
-                    sz = span.get('size', 0)
-                    if sz:
-                        total_sz += float(sz)
-                        count += 1
-        avg = (total_sz / count) if count>0 else 0.0
+        x0, y0, x1, y1 = region_rect(r)
+        inside = [sz for bbox, sz in spans if _rects_overlap(bbox, x0, y0, x1, y1)]
+        avg = (sum(inside) / len(inside)) if inside else 0.0
         sizes.append(avg)
 
     max_sz = max(sizes) if sizes else 0.0
@@ -878,7 +1085,7 @@ def infer_headings_for_page(root, canvas, html_text, listbox):
         messagebox.showinfo('Info', 'Could not detect font sizes on this page.')
         return
 
-    push_undo()
+    push_undo(state.page_index)
     for i, r in enumerate(regs):
         avg = sizes[i]
         ratio = avg / max_sz if max_sz>0 else 0
@@ -892,8 +1099,8 @@ def infer_headings_for_page(root, canvas, html_text, listbox):
             new_tag = 'p'
         # update tag and id (prefix)
         r['tag'] = new_tag
-        r['id'] = f"{new_tag}_{r['id']}"
-    render_current_page(root, canvas, html_text, listbox)
+        r['id'] = tagged_region_id(new_tag, r['id'])
+    refresh_overlays_only(root, canvas, html_text, listbox)
     messagebox.showinfo('Headings', 'Heading inference completed for current page.')
 
 # ---------- Toggle AUTO entities ----------
@@ -902,113 +1109,123 @@ def toggle_auto_entities(btn, root, canvas, html_text, listbox):
     AUTO_ENTITIES = not AUTO_ENTITIES
     btn.config(text=f"AUTO entities: {'ON' if AUTO_ENTITIES else 'OFF'}")
     # re-render current page to show effect
-    render_current_page(root, canvas, html_text, listbox)
+    refresh_overlays_only(root, canvas, html_text, listbox)
 
 # ---------- Toggle nesting preference ----------
 def toggle_nesting(btn, root, canvas, html_text, listbox):
-    global NESTING_PREF
+    global NESTING_PREF, _active_wrap
     NESTING_PREF = 'i_outside_b' if NESTING_PREF == 'b_outside_i' else 'b_outside_i'
+    _active_wrap = _WRAPPERS[NESTING_PREF]
     btn.config(text=f"Nest: {'b>i' if NESTING_PREF=='b_outside_i' else 'i>b'}")
     # re-render current page so extract_text uses new nesting on new selections
-    render_current_page(root, canvas, html_text, listbox)
+    refresh_overlays_only(root, canvas, html_text, listbox)
 
 
 
 # ---------- Build UI ----------
-root = tk.Tk()
-root.geometry('1220x820')
-root.title('PDF Paragraph Tagger - All Options (AUTO entities, headings, nesting)')
-root.title("Para")
-# Left pane: controls + canvas + listbox
-left = tk.Frame(root)
-left.pack(side='left', fill='y', padx=6, pady=6)
-
-controls = tk.Frame(left)
-controls.pack(side='top', pady=4)
-
-open_btn = tk.Button(controls, text='Open PDF', command=lambda: open_pdf(root, canvas, html_text, listbox))
-open_btn.grid(row=0, column=0, padx=3)
-prev_btn = tk.Button(controls, text='Prev', command=lambda: prev_page(root, canvas, html_text, listbox))
-prev_btn.grid(row=0, column=1, padx=3)
-next_btn = tk.Button(controls, text='Next', command=lambda: next_page(root, canvas, html_text, listbox))
-next_btn.grid(row=0, column=2, padx=3)
-auto_btn = tk.Button(controls, text='Auto-Detect', command=lambda: auto_detect(state.page_index, canvas, html_text, listbox))
-auto_btn.grid(row=0, column=3, padx=3)
-export_btn = tk.Button(controls, text='Export JSON', command=export_json)
-export_btn.grid(row=0, column=4, padx=3)
-import_btn = tk.Button(controls, text='Import JSON', command=lambda: import_json(root, canvas, html_text, listbox))
-import_btn.grid(row=0, column=5, padx=3)
-save_html_btn = tk.Button(controls, text='Save HTML (wrapped)', command=lambda: save_html_to_file(html_text))
-save_html_btn.grid(row=0, column=6, padx=3)
-save_all_btn = tk.Button(controls, text='Save All Pages (wrapped)', command=lambda: save_all_pages_html(html_text))
-save_all_btn.grid(row=0, column=7, padx=3)
-sync_btn = tk.Button(controls, text='Sync HTML->PDF', command=lambda: sync_html_to_pdf(html_text, canvas))
-sync_btn.grid(row=0, column=8, padx=3)
-undo_btn = tk.Button(controls, text='Undo', command=lambda: do_undo(root, canvas, html_text, listbox))
-undo_btn.grid(row=0, column=9, padx=3)
-redo_btn = tk.Button(controls, text='Redo', command=lambda: do_redo(root, canvas, html_text, listbox))
-redo_btn.grid(row=0, column=10, padx=3)
-
-
-
-# new controls row: AUTO toggle, infer headings, nesting toggle
-row2 = tk.Frame(left)
-row2.pack(side='top', pady=6)
-auto_toggle_btn = tk.Button(row2, text=f"AUTO entities: {'ON' if AUTO_ENTITIES else 'OFF'}",
-                            command=lambda: toggle_auto_entities(auto_toggle_btn, root, canvas, html_text, listbox))
-auto_toggle_btn.pack(side='left', padx=3)
-infer_btn = tk.Button(row2, text='Infer Headings (page)', command=lambda: infer_headings_for_page(root, canvas, html_text, listbox))
-infer_btn.pack(side='left', padx=3)
-nest_btn = tk.Button(row2, text=f"Nest: {'b>i' if NESTING_PREF=='b_outside_i' else 'i>b'}",
-                     command=lambda: toggle_nesting(nest_btn, root, canvas, html_text, listbox))
-nest_btn.pack(side='left', padx=3)
-
-instr = tk.Label(left, text='Drag to create rectangle. Ctrl+Click word to split. Select region -> press keys (h,j,k,l,f,t,p,n,b,m) to change tag. Ctrl+Z / Ctrl+Y undo/redo.')
-instr.pack(pady=6)
-
-canvas = tk.Canvas(left, bg='grey')
-canvas.pack()
-
-listbox_frame = tk.Frame(left)
-listbox_frame.pack(fill='x', pady=6)
-listbox_label = tk.Label(listbox_frame, text='Regions on page:')
-listbox_label.pack(anchor='w')
-listbox = tk.Listbox(listbox_frame, height=10)
-listbox.pack(fill='x')
-
-# Right pane: HTML editor
-right = tk.Frame(root)
-right.pack(side='left', fill='both', expand=True, padx=6, pady=6)
-html_label = tk.Label(right, text='HTML preview / editor:')
-html_label.pack(anchor='w')
-html_text = tk.Text(right, wrap='word')
-html_text.pack(fill='both', expand=True)
-html_text.insert(tk.END, '<!-- Open a PDF to start -->')
-html_text.config(state='disabled')
-
-# ---------- Bindings ----------
-canvas.bind('<ButtonPress-1>', lambda e: canvas_mouse_down(e, canvas))
-canvas.bind('<B1-Motion>', lambda e: canvas_mouse_drag(e, canvas))
-canvas.bind('<ButtonRelease-1>', lambda e: canvas_mouse_up(e, canvas, html_text, listbox))
-canvas.bind('<Button-3>', lambda e: canvas_right_click(e, canvas, listbox, html_text))
-canvas.bind('<Control-Button-1>', lambda e: canvas_click_word(e, canvas, html_text, listbox))
-
-listbox.bind('<<ListboxSelect>>', lambda e: listbox_select(e, canvas, html_text))
-
-html_text.bind('<Return>', lambda e: (split_region_at_html_cursor(html_text, canvas, listbox), 'break'))
-
-root.bind_all('<Control-z>', lambda e: do_undo(root, canvas, html_text, listbox))
-root.bind_all('<Control-y>', lambda e: do_redo(root, canvas, html_text, listbox))
-root.bind_all('<Key>', lambda e: key_tag_handler(e, canvas, html_text, listbox))
-
-# Arrow keys
-# Left arrow -> previous page, Right arrow -> next page
-root.bind_all('<Left>', lambda e: prev_page(root, canvas, html_text, listbox))
-root.bind_all('<Right>', lambda e: next_page(root, canvas, html_text, listbox))
-
-# Context menu buttons (optional): delete selected region
-del_btn = tk.Button(left, text='Delete Region', command=lambda: delete_region(listbox, canvas, html_text))
-del_btn.pack(pady=6)
-
-# Start main loop
-root.mainloop()
+root = None   # Tk root, created by launch_ui(); the helpers above import without a display
+
+def launch_ui():
+    global root
+    root = tk.Tk()
+    root.geometry('1220x820')
+    root.title('PDF Paragraph Tagger - All Options (AUTO entities, headings, nesting)')
+    root.title("Para")
+    # Left pane: controls + canvas + listbox
+    left = tk.Frame(root)
+    left.pack(side='left', fill='y', padx=6, pady=6)
+
+    controls = tk.Frame(left)
+    controls.pack(side='top', pady=4)
+
+    open_btn = tk.Button(controls, text='Open PDF', command=lambda: open_pdf(root, canvas, html_text, listbox))
+    open_btn.grid(row=0, column=0, padx=3)
+    prev_btn = tk.Button(controls, text='Prev', command=lambda: prev_page(root, canvas, html_text, listbox))
+    prev_btn.grid(row=0, column=1, padx=3)
+    next_btn = tk.Button(controls, text='Next', command=lambda: next_page(root, canvas, html_text, listbox))
+    next_btn.grid(row=0, column=2, padx=3)
+    auto_btn = tk.Button(controls, text='Auto-Detect', command=lambda: auto_detect(state.page_index, canvas, html_text, listbox))
+    auto_btn.grid(row=0, column=3, padx=3)
+    export_btn = tk.Button(controls, text='Export JSON', command=export_json)
+    export_btn.grid(row=0, column=4, padx=3)
+    import_btn = tk.Button(controls, text='Import JSON', command=lambda: import_json(root, canvas, html_text, listbox))
+    import_btn.grid(row=0, column=5, padx=3)
+    save_html_btn = tk.Button(controls, text='Save HTML (wrapped)', command=lambda: save_html_to_file(html_text))
+    save_html_btn.grid(row=0, column=6, padx=3)
+    save_all_btn = tk.Button(controls, text='Save All Pages (wrapped)', command=lambda: save_all_pages_html(html_text))
+    save_all_btn.grid(row=0, column=7, padx=3)
+    sync_btn = tk.Button(controls, text='Sync HTML->PDF', command=lambda: sync_html_to_pdf(html_text, canvas))
+    sync_btn.grid(row=0, column=8, padx=3)
+    undo_btn = tk.Button(controls, text='Undo', command=lambda: do_undo(root, canvas, html_text, listbox))
+    undo_btn.grid(row=0, column=9, padx=3)
+    redo_btn = tk.Button(controls, text='Redo', command=lambda: do_redo(root, canvas, html_text, listbox))
+    redo_btn.grid(row=0, column=10, padx=3)
+
+
+
+    # new controls row: AUTO toggle, infer headings, nesting toggle
+    row2 = tk.Frame(left)
+    row2.pack(side='top', pady=6)
+    auto_toggle_btn = tk.Button(row2, text=f"AUTO entities: {'ON' if AUTO_ENTITIES else 'OFF'}",
+                                command=lambda: toggle_auto_entities(auto_toggle_btn, root, canvas, html_text, listbox))
+    auto_toggle_btn.pack(side='left', padx=3)
+    infer_btn = tk.Button(row2, text='Infer Headings (page)', command=lambda: infer_headings_for_page(root, canvas, html_text, listbox))
+    infer_btn.pack(side='left', padx=3)
+    nest_btn = tk.Button(row2, text=f"Nest: {'b>i' if NESTING_PREF=='b_outside_i' else 'i>b'}",
+                         command=lambda: toggle_nesting(nest_btn, root, canvas, html_text, listbox))
+    nest_btn.pack(side='left', padx=3)
+
+    instr = tk.Label(left, text='Drag to create rectangle. Ctrl+Click word to split. Select region -> press keys (h,j,k,l,f,t,p,n,b,m) to change tag. Ctrl+Z / Ctrl+Y undo/redo.')
+    instr.pack(pady=6)
+
+    canvas = tk.Canvas(left, bg='grey')
+    canvas.pack()
+
+    listbox_frame = tk.Frame(left)
+    listbox_frame.pack(fill='x', pady=6)
+    listbox_label = tk.Label(listbox_frame, text='Regions on page:')
+    listbox_label.pack(anchor='w')
+    listbox = tk.Listbox(listbox_frame, height=10)
+    listbox.pack(fill='x')
+
+    # Right pane: HTML editor
+    right = tk.Frame(root)
+    right.pack(side='left', fill='both', expand=True, padx=6, pady=6)
+    html_label = tk.Label(right, text='HTML preview / editor:')
+    html_label.pack(anchor='w')
+    html_text = tk.Text(right, wrap='word')
+    html_text.pack(fill='both', expand=True)
+    html_text.insert(tk.END, '<!-- Open a PDF to start -->')
+    html_text.config(state='disabled')
+
+    # ---------- Bindings ----------
+    canvas.bind('<ButtonPress-1>', lambda e: canvas_mouse_down(e, canvas))
+    canvas.bind('<B1-Motion>', lambda e: canvas_mouse_drag(e, canvas))
+    canvas.bind('<ButtonRelease-1>', lambda e: canvas_mouse_up(e, canvas, html_text, listbox))
+    canvas.bind('<Button-3>', lambda e: canvas_right_click(e, canvas, listbox, html_text))
+    canvas.bind('<Control-Button-1>', lambda e: canvas_click_word(e, canvas, html_text, listbox))
+
+    listbox.bind('<<ListboxSelect>>', lambda e: listbox_select(e, canvas, html_text))
+
+    html_text.bind('<Return>', lambda e: (split_region_at_html_cursor(html_text, canvas, listbox), 'break'))
+
+    root.bind_all('<Control-z>', lambda e: do_undo(root, canvas, html_text, listbox))
+    root.bind_all('<Control-y>', lambda e: do_redo(root, canvas, html_text, listbox))
+    root.bind_all('<Key>', lambda e: key_tag_handler(e, canvas, html_text, listbox))
+
+    # Arrow keys
+    # Left arrow -> previous page, Right arrow -> next page
+    root.bind_all('<Left>', lambda e: prev_page(root, canvas, html_text, listbox))
+    root.bind_all('<Right>', lambda e: next_page(root, canvas, html_text, listbox))
+
+    # Context menu buttons (optional): delete selected region
+    del_btn = tk.Button(left, text='Delete Region', command=lambda: delete_region(listbox, canvas, html_text))
+    del_btn.pack(pady=6)
+
+    # Start main loop
+    root.mainloop()
+
+
+# ---------- Run ----------
+if __name__ == '__main__':
+    launch_ui()
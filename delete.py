@@ -1,8 +1,20 @@
 import fitz  # PyMuPDF
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
-from PIL import Image, ImageTk
-import copy
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import queue
+
+PIX_CACHE_MAX = 8   # rendered pages kept, keyed by (page, scale)
+RESIZE_DEBOUNCE_MS = 80   # re-fit the page only once a resize settles
+RESULT_POLL_MS = 30       # how often Tk collects finished background renders
+
+# apply_redactions options for pages where only text blocks were deleted:
+# leave images and vector graphics alone (graphics= needs PyMuPDF >= 1.24.2)
+TEXT_ONLY_REDACT = {"images": fitz.PDF_REDACT_IMAGE_NONE}
+if hasattr(fitz, "PDF_REDACT_LINE_ART_NONE"):
+    TEXT_ONLY_REDACT["graphics"] = fitz.PDF_REDACT_LINE_ART_NONE
 
 class PDFHTMLSyncEditor:
     def __init__(self, root):
@@ -14,8 +26,9 @@ class PDFHTMLSyncEditor:
         self.blocks = []                # original block coords (PDF space)
         self.block_visual_rects = []    # scaled block coords for display/selection
         self.deleted_blocks = {}
-        self.history = []
-        self.block_rect_ids = []
+        self.history = []               # [(page, that page's deleted list before the edit), ...]
+        self._rect_id_by_block = {}     # block index -> canvas rectangle id
+        self._cross_ids = {}            # deleted block index -> its two cross line ids
         self.current_page = 0
 
         self.selected_block = None
@@ -25,6 +38,21 @@ class PDFHTMLSyncEditor:
 
         self.scale = 1.0
         self.last_canvas_size = (0, 0)
+        self._resize_job = None
+        self._overlay_job = None          # pending after_idle that draws the block rectangles
+        self._pix_cache = OrderedDict()   # (page, scale) -> (PhotoImage, width, height)
+        self._blocks_cache = {}           # page index -> get_text("blocks") of the opened PDF
+        self._page_rects = {}             # page index -> mediabox of the opened PDF
+        # pixmaps are rendered off the Tk thread; every fitz call holds _doc_lock.
+        # Results come back through _results, which only the Tk thread drains
+        self._results = queue.Queue()
+        self._polling = False             # _poll_results is scheduled
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._doc_lock = threading.RLock()
+        self._pending_key = None          # (doc, page, scale) whose bitmap the canvas is waiting for
+        self._inflight = set()            # (doc, page, scale) keys submitted and not yet back
+        self._prefetch_jobs = []          # after_idle ids for neighbour prefetch
+        self._prefetch_futs = []          # [(key, future), ...] neighbour renders not yet started
 
         # ===== BUTTON BAR =====
         top_bar = tk.Frame(root, bg="#ececec")
@@ -78,6 +106,9 @@ class PDFHTMLSyncEditor:
         self.doc = fitz.open(path)
         self.deleted_blocks.clear()
         self.history.clear()
+        self._pix_cache.clear()
+        self._blocks_cache.clear()
+        self._page_rects.clear()
         self.current_page = 0
         self.show_page()
 
@@ -87,76 +118,254 @@ class PDFHTMLSyncEditor:
         new_size = (event.width, event.height)
         if new_size != self.last_canvas_size:
             self.last_canvas_size = new_size
-            # Redraw current page to recompute scale
-            self.show_page()
+            # Redraw current page to recompute scale, once the drag stops
+            if self._resize_job:
+                self.root.after_cancel(self._resize_job)
+            self._resize_job = self.root.after(RESIZE_DEBOUNCE_MS, self._resize_done)
+
+    def _resize_done(self):
+        self._resize_job = None
+        self.show_page()
 
     # ===== SHOW PAGE (zoom-to-fit) =====
     def show_page(self):
         if not self.doc:
             return
-        self.page = self.doc.load_page(self.current_page)
+        self._cancel_prefetch()
+        self._render_bitmap()
+        self._redraw_overlays()
+        # warm the cache for Left/Right once the UI is idle
+        self._prefetch_jobs = [self.root.after_idle(self._prefetch, pg)
+                               for pg in (self.current_page + 1, self.current_page - 1)]
 
-        # get canvas size to compute scale-to-fit
-        canvas_w = max(self.canvas.winfo_width(), 100)
-        canvas_h = max(self.canvas.winfo_height(), 100)
+    def _canvas_size(self):
+        return max(self.canvas.winfo_width(), 100), max(self.canvas.winfo_height(), 100)
 
-        # original page size
-        rect = self.page.mediabox
-        page_w = rect.width
-        page_h = rect.height
+    def _fit_scale(self, rect, canvas_size):
+        # canvas_size is read on the Tk thread (_canvas_size), so the worker can fit too
+        canvas_w, canvas_h = canvas_size
 
         # compute scale that fits entire page into canvas (with margin)
         margin = 16
-        scale_x = (canvas_w - margin) / page_w
-        scale_y = (canvas_h - margin) / page_h
+        scale_x = (canvas_w - margin) / rect.width
+        scale_y = (canvas_h - margin) / rect.height
         # choose the smaller scale so whole page is visible (zoom out if needed)
-        self.scale = min(scale_x, scale_y, 1.0)
-        if self.scale <= 0:
-            self.scale = 1.0
+        scale = min(scale_x, scale_y, 1.0)
+        return scale if scale > 0 else 1.0
 
-        mat = fitz.Matrix(self.scale, self.scale)
-        pix = self.page.get_pixmap(matrix=mat)
-
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        self.page_image = ImageTk.PhotoImage(img)
-
-        # Clear canvas and draw
+    def _render_bitmap(self):
+        # Clear canvas; the page image goes under the block overlays when ready
         self.canvas.delete("all")
-        self.canvas.create_image(0, 0, image=self.page_image, anchor="nw")
+        total_pages = len(self.doc)
+        self.page_label.config(text=f"Page: {self.current_page + 1} / {total_pages}")
 
-        # Prepare blocks and scaled rectangles for interaction
-        self.blocks = self.page.get_text("blocks")
-        self.block_visual_rects.clear()
-        self.block_rect_ids.clear()
-        self.selected_block = None
+        pg = self.current_page
+        rect = self._page_rects.get(pg)
+        if rect is None and (self.doc, pg, None) in self._inflight:
+            # its prefetch is loading this page right now: show the page when
+            # that lands instead of waiting on _doc_lock behind it
+            self.blocks = []
+            self._pending_key = (self.doc, pg, None)
+            return
+        if rect is None:
+            with self._doc_lock:
+                self.page = self.doc.load_page(pg)
+                # original page size
+                rect = self._page_rects[pg] = self.page.mediabox
+                self._get_blocks(pg, self.page)
+        self.scale = self._fit_scale(rect, self._canvas_size())
+
+        self.blocks = self._get_blocks(pg)
+
+        # reuse the rendered page while neither page nor scale changed
+        key = (self.current_page, round(self.scale, 3))
+        cached = self._pix_cache.get(key)
+        if cached is not None:
+            self._pix_cache.move_to_end(key)
+            self._pending_key = None
+            self._place_bitmap(cached)
+            return
+        self._pending_key = (self.doc,) + key
+        self._request_pixmap(self._pending_key, self.scale)
+
+    def _request_pixmap(self, key, scale, canvas_size=None, with_blocks=False):
+        # one render per key at a time; a prefetch already running is reused
+        if key in self._inflight:
+            return None
+        self._inflight.add(key)
+        doc, pg, _ = key
+        fut = self._executor.submit(self._rasterize, doc, pg, scale, canvas_size, with_blocks)
+        # runs on the worker thread, so it only queues the result for _poll_results
+        fut.add_done_callback(lambda f: f.cancelled() or self._results.put((key, f)))
+        if not self._polling:
+            self._polling = True
+            self.root.after(RESULT_POLL_MS, self._poll_results)
+        return fut
+
+    def _poll_results(self):
+        # Tk thread: apply the renders finished since the last poll
+        try:
+            while True:
+                try:
+                    key, fut = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                self._on_pixmap_ready(key, fut)
+        finally:
+            # keep polling even if applying one result raised
+            if self._inflight:
+                self.root.after(RESULT_POLL_MS, self._poll_results)
+            else:
+                self._polling = False
 
-        deleted = self.deleted_blocks.get(self.current_page, [])
-        html = ""
+    def _prefetch(self, pg):
+        if not self.doc or not (0 <= pg < len(self.doc)):
+            return
+        canvas_size = self._canvas_size()
+        rect = self._page_rects.get(pg)
+        if rect is None:
+            # a page not loaded yet: the worker fits it and brings back its
+            # mediabox and blocks, so neither this nor show_page needs _doc_lock
+            full_key = (self.doc, pg, None)
+            fut = self._request_pixmap(full_key, None, canvas_size, pg not in self._blocks_cache)
+        else:
+            scale = self._fit_scale(rect, canvas_size)
+            key = (pg, round(scale, 3))
+            if key in self._pix_cache:
+                return
+            full_key = (self.doc,) + key
+            fut = self._request_pixmap(full_key, scale)
+        if fut is not None:
+            self._prefetch_futs.append((full_key, fut))
+
+    def _cancel_prefetch(self):
+        # the user moved on: drop idle prefetches and any neighbour render not yet started
+        for job in self._prefetch_jobs:
+            self.root.after_cancel(job)
+        self._prefetch_jobs = []
+        for key, fut in self._prefetch_futs:
+            if fut.cancel():
+                self._inflight.discard(key)
+        self._prefetch_futs = []
+
+    def _rasterize(self, doc, pg, scale, canvas_size=None, with_blocks=False):
+        # worker thread: pixmap as PPM bytes; PhotoImage must be made on the Tk thread.
+        # scale None means fit the page to canvas_size here
+        with self._doc_lock:
+            page = doc.load_page(pg)
+            rect = page.mediabox
+            blocks = page.get_text("blocks") if with_blocks else None
+            if scale is None:
+                scale = self._fit_scale(rect, canvas_size)
+            pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+            return rect, blocks, scale, pix.width, pix.height, pix.tobytes("ppm")
+
+    def _on_pixmap_ready(self, key, fut):
+        # Tk thread, via _poll_results
+        self._inflight.discard(key)
+        doc, pg, _ = key
+        if doc is not self.doc:
+            return    # a different PDF was opened meanwhile
+        try:
+            rect, blocks, scale, pix_w, pix_h, ppm = fut.result()
+        except Exception:
+            if key == self._pending_key:
+                self._pending_key = None
+            return    # nothing is cached for this key; the next show_page tries again
+        self._page_rects.setdefault(pg, rect)
+        if blocks is not None:
+            self._blocks_cache.setdefault(pg, blocks)
+        # Tk reads PPM directly, no PIL image in between
+        cached = (tk.PhotoImage(data=ppm), pix_w, pix_h)
+        self._pix_cache[(pg, round(scale, 3))] = cached
+        if len(self._pix_cache) > PIX_CACHE_MAX:
+            self._pix_cache.popitem(last=False)
+        # only the most recently requested page/scale reaches the canvas
+        if key == self._pending_key:
+            self._pending_key = None
+            if key[2] is None:
+                self.show_page()   # its mediabox, blocks and bitmap are all cached now
+            else:
+                self._place_bitmap(cached)
 
-        for i, b in enumerate(self.blocks):
-            x0, y0, x1, y1, text, *_ = b
-            sx0, sy0, sx1, sy1 = x0 * self.scale, y0 * self.scale, x1 * self.scale, y1 * self.scale
-            self.block_visual_rects.append((sx0, sy0, sx1, sy1))
+    def _place_bitmap(self, cached):
+        self.page_image, pix_w, pix_h = cached
+        self.canvas.create_image(0, 0, image=self.page_image, anchor="nw", tags=("bg",))
+        self.canvas.tag_lower("bg")
 
-            if i in deleted:
-                # draw cross using scaled coords
-                self.canvas.create_rectangle(sx0, sy0, sx1, sy1, outline="gray", width=1, dash=(3,3))
-                self.canvas.create_line(sx0, sy0, sx1, sy1, fill="red", width=2)
-                self.canvas.create_line(sx0, sy1, sx1, sy0, fill="red", width=2)
-            else:
-                rect_id = self.canvas.create_rectangle(sx0, sy0, sx1, sy1, outline="red", width=1)
-                self.block_rect_ids.append(rect_id)
-                html += f"<p>{text.strip()}</p>\n"
+        # Update scrollregion so entire scaled page is reachable if larger than canvas
+        self.canvas.config(scrollregion=(0, 0, pix_w, pix_h))
+
+    # ===== BLOCKS (parsed once per page) =====
+    def _get_blocks(self, pg, page=None):
+        # deleted_blocks holds indices into this list, so it is kept for the
+        # whole session, including after save_pdf redacts the pages
+        blocks = self._blocks_cache.get(pg)
+        if blocks is None:
+            with self._doc_lock:
+                if page is None:
+                    page = self.doc.load_page(pg)
+                blocks = self._blocks_cache[pg] = page.get_text("blocks")
+        return blocks
+
+    # ===== BLOCK OVERLAYS + HTML PREVIEW =====
+    def _redraw_overlays(self):
+        # page image stays; hit-test rects are ready now, canvas items follow on idle
+        self.canvas.delete("overlay")
+        self.block_visual_rects.clear()
+        self._rect_id_by_block.clear()
+        self._cross_ids.clear()
+
+        for b in self.blocks:
+            x0, y0, x1, y1 = b[:4]
+            self.block_visual_rects.append((x0 * self.scale, y0 * self.scale, x1 * self.scale, y1 * self.scale))
+
+        # the page image paints first; all block items are then made in one pass
+        if self._overlay_job:
+            self.canvas.after_cancel(self._overlay_job)
+        self._overlay_job = self.canvas.after_idle(self._draw_blocks)
+        self._refresh_deleted()
+
+    def _draw_blocks(self):
+        self._overlay_job = None
+        create = self.canvas.create_rectangle
+        for i, (sx0, sy0, sx1, sy1) in enumerate(self.block_visual_rects):
+            self._rect_id_by_block[i] = create(sx0, sy0, sx1, sy1, outline="red", width=1, tags=("overlay", "blocks"))
+        self._restyle_deleted(set(self.deleted_blocks.get(self.current_page, [])))
 
-        # Update HTML preview
-        self.html_text.delete("1.0", "end")
-        self.html_text.insert("1.0", html)
+    def _refresh_deleted(self):
+        self.canvas.delete("selection")
+        self.selected_block = None
+        deleted = set(self.deleted_blocks.get(self.current_page, []))
+        self._restyle_deleted(deleted)
+        self._update_html_preview(deleted)
+
+    def _restyle_deleted(self, deleted):
+        # restyle only the blocks whose deleted state changed since the last draw
+        # (nothing to do while the rectangles are still waiting on idle)
+        for i in deleted.symmetric_difference(self._cross_ids):
+            if i in self._rect_id_by_block:
+                self._style_block(i, i in deleted)
+
+    def _style_block(self, i, deleted):
+        rect_id = self._rect_id_by_block[i]
+        if deleted:
+            # draw cross using scaled coords
+            sx0, sy0, sx1, sy1 = self.block_visual_rects[i]
+            self.canvas.itemconfigure(rect_id, outline="gray", dash=(3,3))
+            self._cross_ids[i] = (
+                self.canvas.create_line(sx0, sy0, sx1, sy1, fill="red", width=2, tags=("overlay", "blocks")),
+                self.canvas.create_line(sx0, sy1, sx1, sy0, fill="red", width=2, tags=("overlay", "blocks")),
+            )
+        else:
+            self.canvas.itemconfigure(rect_id, outline="red", dash="")
+            self.canvas.delete(*self._cross_ids.pop(i))
 
-        total_pages = len(self.doc)
-        self.page_label.config(text=f"Page: {self.current_page + 1} / {total_pages}")
+    def _update_html_preview(self, deleted):
+        html = "".join(f"<p>{b[4].strip()}</p>\n" for i, b in enumerate(self.blocks) if i not in deleted)
 
-        # Update scrollregion so entire scaled page is reachable if larger than canvas
-        self.canvas.config(scrollregion=(0, 0, pix.width, pix.height))
+        # Update HTML preview
+        self.html_text.replace("1.0", "end", html)
 
     # ===== CLICK PAGE LABEL TO JUMP =====
     def jump_to_page(self, event):
@@ -190,8 +399,8 @@ class PDFHTMLSyncEditor:
     def delete_action(self, event):
         if not self.doc:
             return
-        # push current state for undo
-        self.history.append(copy.deepcopy(self.deleted_blocks))
+        # push current state for undo; only this page can change
+        self.history.append((self.current_page, list(self.deleted_blocks.get(self.current_page, []))))
 
         # Left click delete (selected block)
         if self.selected_block is not None:
@@ -199,23 +408,22 @@ class PDFHTMLSyncEditor:
             if self.selected_block not in lst:
                 lst.append(self.selected_block)
             self.selected_block = None
-            self.show_page()
+            self._refresh_deleted()
             return
 
         # Right drag delete
         if self.drag_area:
             x0, y0, x1, y1 = self.drag_area
-            to_delete = []
-            for i, (sx0, sy0, sx1, sy1) in enumerate(self.block_visual_rects):
-                # Check overlap with drag area (all in scaled canvas coords)
-                if not (sx1 < x0 or sx0 > x1 or sy1 < y0 or sy0 > y1):
-                    lst = self.deleted_blocks.setdefault(self.current_page, [])
-                    if i not in lst:
-                        lst.append(i)
-                        to_delete.append(i)
+            # Check overlap with drag area (all in scaled canvas coords)
+            hits = [i for i, (sx0, sy0, sx1, sy1) in enumerate(self.block_visual_rects)
+                    if not (sx1 < x0 or sx0 > x1 or sy1 < y0 or sy0 > y1)]
+            if hits:
+                lst = self.deleted_blocks.setdefault(self.current_page, [])
+                already = set(lst)
+                lst.extend(i for i in hits if i not in already)
 
             self.drag_area = None
-            self.show_page()
+            self._refresh_deleted()
 
     # ===== DRAG SELECTION =====
     def start_drag(self, event):
@@ -265,22 +473,21 @@ class PDFHTMLSyncEditor:
     def undo(self, event):
         if not self.history:
             return
-        self.deleted_blocks = self.history.pop()
-        self.show_page()
+        pg, deleted = self.history.pop()
+        self.deleted_blocks[pg] = deleted
+        self._refresh_deleted()
 
     # ===== EXPORT HTML =====
     def export_html(self):
         if not self.doc:
             return
-        html = "<html><body>\n"
+        parts = ["<html><body>\n"]
         for pg in range(len(self.doc)):
-            page = self.doc.load_page(pg)
-            blocks = page.get_text("blocks")
-            deleted = self.deleted_blocks.get(pg, [])
-            for i, b in enumerate(blocks):
-                if i not in deleted:
-                    html += f"<p>{b[4].strip()}</p>\n"
-        html += "</body></html>"
+            blocks = self._get_blocks(pg)
+            deleted = set(self.deleted_blocks.get(pg, []))
+            parts.extend(f"<p>{b[4].strip()}</p>\n" for i, b in enumerate(blocks) if i not in deleted)
+        parts.append("</body></html>")
+        html = "".join(parts)
         save_path = filedialog.asksaveasfilename(defaultextension=".html", filetypes=[("HTML Files", "*.html")])
         if save_path:
             with open(save_path, "w", encoding="utf-8") as f:
@@ -296,18 +503,24 @@ class PDFHTMLSyncEditor:
         if not save_path:
             return
         
-        for pg_num in range(len(self.doc)):
-            page = self.doc.load_page(pg_num)
-            deleted = self.deleted_blocks.get(pg_num, [])
-            blocks = page.get_text("blocks")
-            for i in deleted:
-                if i < len(blocks):
-                    x0, y0, x1, y1, *_ = blocks[i]
-                    page.add_redact_annot(fitz.Rect(x0, y0, x1, y1), fill=(1,1,1))
-            # Apply redactions to remove text
-            page.apply_redactions()
-        
-        self.doc.save(save_path)
+        with self._doc_lock:
+            for pg_num, deleted in self.deleted_blocks.items():
+                if not deleted:
+                    continue
+                page = self.doc.load_page(pg_num)
+                blocks = self._get_blocks(pg_num, page)
+                hit = [blocks[i] for i in deleted if i < len(blocks)]
+                for b in hit:
+                    page.add_redact_annot(fitz.Rect(b[:4]), fill=(1,1,1))
+                # Apply redactions to remove text; image blocks (type 1) still take the default path
+                if any(b[6] == 1 for b in hit):
+                    page.apply_redactions()
+                else:
+                    page.apply_redactions(**TEXT_ONLY_REDACT)
+            # page images now show the redactions; block lists stay as they were
+            self._pix_cache.clear()
+
+            self.doc.save(save_path)
         messagebox.showinfo("Saved", f"Updated PDF saved to:\n{save_path}")
 
 
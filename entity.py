@@ -5,25 +5,47 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 
 
+class _EntityTable(dict):
+    # str.translate table: ASCII maps to itself, named entities come from
+    # codepoint2name, any other codepoint gets its numeric entity on first use
+    def __missing__(self, cp):
+        ent = self[cp] = f"&#{cp};"
+        return ent
+
+
+# numeric entities prebuilt for the scripts PDF text mostly uses (Latin,
+# Greek, Cyrillic, punctuation, symbols); CJK and the rest fill in lazily
+_NUMERIC_PRELOAD = range(0x80, 0x3000)
+
+_ENTITY_TABLE = _EntityTable({
+    **{cp: f"&#{cp};" for cp in _NUMERIC_PRELOAD},
+    **{cp: cp for cp in range(128)},
+    **{cp: f"&{name};" for cp, name in codepoint2name.items() if cp >= 128},
+})
+
+
+_NONASCII_RE = re.compile(r"[^\x00-\x7f]")
+
+
 def convert_chars_to_entities(text):
-    result = []
+    # Keep normal ASCII characters; named entity if there is one, else numeric
+    if text.isascii():
+        return text
+    # the ASCII prefix is copied as-is; only the tail goes through translate
+    start = _NONASCII_RE.search(text).start()
+    return text[:start] + text[start:].translate(_ENTITY_TABLE)
 
-    for ch in text:
-        cp = ord(ch)
 
-        # Keep normal ASCII characters
-        if cp < 128:
-            result.append(ch)
-            continue
+_HIGH_BYTES_RE = re.compile(rb"[\x80-\xff]+")
 
-        # Named entity
-        if cp in codepoint2name:
-            result.append(f"&{codepoint2name[cp]};")
-        else:
-            # Numeric entity
-            result.append(f"&#{cp};")
 
-    return "".join(result)
+def convert_bytes_to_entities(data):
+    # Same conversion on UTF-8 bytes: ASCII is never decoded, only the
+    # non-ASCII runs are, and their entities are ASCII again
+    if data.isascii():
+        return data
+    return _HIGH_BYTES_RE.sub(
+        lambda m: convert_chars_to_entities(m[0].decode("utf-8")).encode("ascii"), data)
 
 
 def main():
@@ -51,12 +73,12 @@ def main():
         messagebox.showerror("Error", "No output file selected")
         return
 
-    with open(input_file, "r", encoding="utf-8") as f:
-        text = f.read()
+    with open(input_file, "rb") as f:
+        data = f.read()
 
-    converted = convert_chars_to_entities(text)
+    converted = convert_bytes_to_entities(data)
 
-    with open(output_file, "w", encoding="utf-8") as f:
+    with open(output_file, "wb") as f:
         f.write(converted)
 
     messagebox.showinfo("Done", "Entity conversion completed!")
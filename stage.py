@@ -2,19 +2,33 @@ import fitz
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
-import copy
 import math
 import json
+from array import array
+from collections import OrderedDict
+import threading
+
+PIL_CACHE_MAX = 8   # page images rendered per (page, scale), most recently used last
+TK_CACHE_MAX = 12   # sharp (MuPDF-rendered) PhotoImages kept per (page, scale)
+ZOOM_SETTLE_MS = 150   # wheel-zoom idle time before the sharp redraw
+CLIP_MIN_PIXELS = 4_000_000   # zoomed pages bigger than this render only around the viewport
+CLIP_MARGIN = 0.5   # viewport fraction rendered beyond each edge, so small scrolls stay inside
+GRID_CELL = 64      # PDF units per click-lookup grid cell
+GRID_MIN_PARAS = 32 # pages with fewer paragraphs are just scanned
+# one-pass escaping for export_html (same output as the old &, <, > replaces)
+HTML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
 
 # ---------- Helper functions ----------
-def bbox_contains(bbox, x, y):
-    x0, y0, x1, y1 = bbox
-    return x0 <= x <= x1 and y0 <= y <= y1
+def bbox_columns(paras):
+    # a page's boxes column-wise: (x0s, y0s, x1s, y1s) as flat double arrays
+    if not paras:
+        return tuple(array('d') for _ in range(4))
+    return tuple(array('d', col) for col in zip(*[p['bbox'] for p in paras]))
 
-def words_in_bbox(words, bbox):
-    x0, y0, x1, y1 = bbox
-    inside = [w for w in words if w[0] >= x0-0.1 and w[2] <= x1+0.1 and w[1] >= y0-0.1 and w[3] <= y1+0.1]
-    return sorted(inside, key=lambda w: (w[1], w[0]))
+def scale_bboxes(cols, scale):
+    # every box of a page to canvas coords, one column at a time
+    s = scale
+    return zip(*[[v*s for v in col] for col in cols])
 
 # ---------- Main App ----------
 class PDFParaEditor:
@@ -26,17 +40,35 @@ class PDFParaEditor:
         self.doc = None
         self.current_page = 0
         self.paragraphs_by_page = {}
+        self._para_grid = {}            # page -> {(cx, cy): [para idx, ...]}; dropped when order changes
+        self._bbox_cols = {}            # page -> bbox_columns() of its paragraphs; dropped with the grid
         self.selected_indices = set()
-        self.undo_stack = []
+        self.undo_stack = []            # [(page, copy of that page's paragraphs), ...]
         self.last_right_click = None
         self.split_marker = None
+        self._html_paras = None         # paragraph list the HTML pane shows; reset when it is edited in place
 
         # image & scaling
-        self.page_pil = None            # PIL Image at original pix size
+        self.page_size = None           # current page size at scale 1.0 (72 dpi pixels)
+        self._pil_cache = OrderedDict() # (page, scale) -> PIL Image rendered by MuPDF at that scale
+        # a daemon worker pre-renders neighbour pages into _pil_cache; fitz is not
+        # thread-safe, so every fitz call holds _lock. _pil_cache has its own
+        # _cache_lock, so lookups never wait behind a background render
+        self._lock = threading.RLock()
+        self._cache_lock = threading.Lock()
+        self._prerender_cv = threading.Condition()
+        self._prerender_jobs = {}       # page -> (doc, scale); only the shown page's neighbours
+        threading.Thread(target=self._prerender_loop, daemon=True).start()
+        self._tk_cache = OrderedDict()  # (page, scale) -> PhotoImage; also what keeps them alive
         self.page_tk = None             # Tk PhotoImage used on canvas
         self.scale = 1.0                # current scale factor (1.0 = original pix size)
         self.min_scale = 0.1
         self.max_scale = 5.0
+        self._interactive = False       # True while wheel-zooming: resize with BILINEAR
+        self._zooming_after_id = None
+        self._pending_redraw = False    # a coalesced zoom redraw is scheduled
+        self._zoom_anchor = None        # PDF point to re-center once that redraw runs
+        self._clip = None               # (page, scale, region) when page_tk is only a clip of the page
 
         # ---------- UI ----------
         top_bar = tk.Frame(master, bg="#ddd")
@@ -76,8 +108,8 @@ class PDFParaEditor:
                                 xscrollcommand=self.hbar.set,
                                 yscrollcommand=self.vbar.set)
         self.canvas.pack(fill="both", expand=True)
-        self.hbar.config(command=self.canvas.xview)
-        self.vbar.config(command=self.canvas.yview)
+        self.hbar.config(command=self.on_xscroll)
+        self.vbar.config(command=self.on_yscroll)
         main.add(left_frame, minsize=400)
 
         # Right HTML preview
@@ -105,66 +137,210 @@ class PDFParaEditor:
         self.canvas_image_id = None
         self.canvas_rects = []
         self.canvas_labels = []
+        self._rect_pool = []            # slot per paragraph index; None until it first scrolls into view
+        self._label_pool = []
+        self._shown = set()             # pool slots currently in state "normal"
+        self._pending_cull = False      # an overlay redraw for the new viewport is scheduled
 
     # ---------- Open PDF ----------
     def open_pdf(self):
         path = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
         if not path:
             return
-        try:
-            self.doc = fitz.open(path)
-        except Exception as e:
-            messagebox.showerror("Error", f"Cannot open PDF: {e}")
-            return
-
-        self.paragraphs_by_page.clear()
-        self.current_page = 0
-        for pno in range(len(self.doc)):
-            page = self.doc.load_page(pno)
-            blocks = page.get_text("blocks")
-            words = page.get_text("words")
-            paras = []
-            for idx, b in enumerate(blocks):
-                x0, y0, x1, y1, text = b[0], b[1], b[2], b[3], b[4]
-                w_in = words_in_bbox(words, (x0, y0, x1, y1))
-                paras.append({'bbox': (x0, y0, x1, y1), 'text': text.strip(), 'words': w_in, 'number': idx+1})
-            self.paragraphs_by_page[pno] = paras
+        with self._lock:
+            try:
+                self.doc = fitz.open(path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Cannot open PDF: {e}")
+                return
+
+            self.paragraphs_by_page.clear()
+            self._para_grid.clear()
+            self._bbox_cols.clear()
+            with self._cache_lock:
+                self._pil_cache.clear()
+            self._tk_cache.clear()
+            self.current_page = 0
         self.scale = 1.0
         self.show_page()
 
+    def _get_paras(self, pno):
+        # pages are parsed the first time they are needed, not all at open
+        paras = self.paragraphs_by_page.get(pno)
+        if paras is not None:
+            return paras
+        with self._lock:
+            if pno not in self.paragraphs_by_page:
+                page = self.doc.load_page(pno)
+                blocks = page.get_text("blocks")
+                paras = []
+                for idx, b in enumerate(blocks):
+                    x0, y0, x1, y1, text = b[0], b[1], b[2], b[3], b[4]
+                    paras.append({'bbox': (x0, y0, x1, y1), 'text': text.strip(), 'number': idx+1})
+                self.paragraphs_by_page[pno] = paras
+            return self.paragraphs_by_page[pno]
+
+    def _get_all_paras(self):
+        # exports cover every page, so parse whatever has not been opened yet
+        return [(pno, self._get_paras(pno)) for pno in range(len(self.doc))]
+
     # ---------- Show Page ----------
     def show_page(self):
         if not self.doc:
             return
-        page = self.doc.load_page(self.current_page)
-        pix = page.get_pixmap()
-        # store original PIL image (RGB)
-        self.page_pil = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
+        with self._lock:
+            rect = self.doc.load_page(self.current_page).rect
+        self.page_size = (rect.width, rect.height)
+        self._render_scaled()
+        if self._interactive:
+            return  # wheel-zoom scales are throwaway; _finish_zoom asks again
+        # readers usually go forward: have the neighbours parsed and ready at this
+        # zoom (when zoomed past clipping they are just parsed; a full render is wasted)
+        scale = self.scale if not self._use_clip() else None
+        with self._prerender_cv:
+            # older requests are for pages no longer next to the one shown
+            self._prerender_jobs.clear()
+            for pno in (self.current_page + 1, self.current_page - 1):
+                self._prerender_jobs[pno] = (self.doc, scale)
+            self._prerender_cv.notify()
+
+    def _page_pil(self, pno, scale, speculative=False, doc=None):
+        # MuPDF rasterizes at the target scale directly, which is sharper and
+        # much cheaper than resampling a 1.0 render. doc is the PDF a
+        # pre-render job was queued for; None means the one open now
+        if doc is None:
+            doc = self.doc
+        key = (pno, round(scale, 3))
+        with self._cache_lock:
+            pil = self._pil_cache.get(key)
+            if pil is not None:
+                if not speculative:
+                    self._pil_cache.move_to_end(key)
+                return pil
+        with self._lock:
+            pix = doc.load_page(pno).get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+        pil = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        with self._cache_lock:
+            if doc is not self.doc:
+                return pil    # open_pdf replaced the PDF meanwhile: not cached
+            if key not in self._pil_cache and len(self._pil_cache) >= PIL_CACHE_MAX:
+                self._pil_cache.popitem(last=False)
+            self._pil_cache[key] = pil
+            if speculative:
+                # pre-renders go in at the cold end, so they never push out
+                # renders of pages the user actually looked at
+                self._pil_cache.move_to_end(key, last=False)
+        return pil
+
+    def _prerender_loop(self):
+        # worker thread: produces PIL images only, never touches Tk
+        while True:
+            with self._prerender_cv:
+                while not self._prerender_jobs:
+                    self._prerender_cv.wait()
+                pno = next(iter(self._prerender_jobs))
+                doc, scale = self._prerender_jobs.pop(pno)
+            with self._lock:
+                # skip requests for a PDF that has since been replaced
+                if doc is not self.doc or not 0 <= pno < len(doc):
+                    continue
+            try:
+                # _lock is held per fitz call only, so the UI waits for at most
+                # the one parse or render in flight
+                self._get_paras(pno)
+                if scale is not None and not self._interactive:
+                    self._page_pil(pno, scale, speculative=True, doc=doc)
+            except Exception:
+                pass  # rendered again, with errors surfacing, when shown
+
+    def _use_clip(self):
+        return self.page_size[0] * self.page_size[1] * self.scale * self.scale > CLIP_MIN_PIXELS
+
+    def _page_extent(self):
+        # whole page on the canvas at the current scale; in clip mode the image
+        # item covers only part of it, so canvas.bbox("all") is not the page
+        return (max(1, int(self.page_size[0] * self.scale)),
+                max(1, int(self.page_size[1] * self.scale)))
+
+    def _view_region(self, display_w, display_h):
+        # visible canvas area plus CLIP_MARGIN on each side, clamped to the page
+        vx0, vy0 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        vw, vh = self.canvas.winfo_width(), self.canvas.winfo_height()
+        mx, my = vw * CLIP_MARGIN, vh * CLIP_MARGIN
+        return (int(max(0, vx0 - mx)), int(max(0, vy0 - my)),
+                int(min(display_w, vx0 + vw + mx)) + 1, int(min(display_h, vy0 + vh + my)) + 1)
+
+    def _clip_stale(self):
+        # the clip no longer covers what the viewport shows
+        if self._clip is None:
+            return False
+        x0, y0, x1, y1 = self._clip[2]
+        display_w = int(self.page_size[0] * self.scale)
+        display_h = int(self.page_size[1] * self.scale)
+        vx0, vy0 = max(0, self.canvas.canvasx(0)), max(0, self.canvas.canvasy(0))
+        vx1 = min(display_w, vx0 + self.canvas.winfo_width())
+        vy1 = min(display_h, vy0 + self.canvas.winfo_height())
+        return vx0 < x0 or vy0 < y0 or vx1 > x1 or vy1 > y1
+
+    def _preview_source(self):
+        # newest cached render of this page at any scale, for wheel-zoom previews
+        with self._cache_lock:
+            for key in reversed(self._pil_cache):
+                if key[0] == self.current_page:
+                    return self._pil_cache[key]
+        return None
+
+    def _render_scaled(self):
         # apply current scale to create the displayed image
-        display_w = max(1, int(self.page_pil.width * self.scale))
-        display_h = max(1, int(self.page_pil.height * self.scale))
-        resized = self.page_pil.resize((display_w, display_h), Image.LANCZOS)
-        self.page_tk = ImageTk.PhotoImage(resized)
-
-        # clear canvas and create image
-        self.canvas.delete("all")
-        self.canvas_image_id = self.canvas.create_image(0, 0, image=self.page_tk, anchor="nw")
+        display_w = max(1, int(self.page_size[0] * self.scale))
+        display_h = max(1, int(self.page_size[1] * self.scale))
+        # zoom levels already visited come back from the cache; only sharp
+        # images are kept, the BILINEAR ones from wheel zooming are transient
+        key = (self.current_page, round(self.scale, 3))
+        cached = self._tk_cache.get(key)
+        preview = self._preview_source() if cached is None and self._interactive else None
+        origin = (0, 0)   # canvas position of the image's top-left corner
+        self._clip = None
+        if cached is not None:
+            self._tk_cache.move_to_end(key)
+            self.page_tk = cached
+        elif preview is not None:
+            # reducing_gap lets Pillow box-reduce by an integer factor first, so
+            # zooming far out filters a much smaller image
+            self.page_tk = ImageTk.PhotoImage(
+                preview.resize((display_w, display_h), Image.BILINEAR, reducing_gap=3.0))
+        elif self._use_clip():
+            # zoomed far in: rasterize only the viewport region; not cached,
+            # scrolling out of it renders the next region (see _flush_cull)
+            region = self._view_region(display_w, display_h)
+            x0, y0, x1, y1 = region
+            s = self.scale
+            with self._lock:
+                pix = self.doc.load_page(self.current_page).get_pixmap(
+                    matrix=fitz.Matrix(s, s), clip=fitz.Rect(x0/s, y0/s, x1/s, y1/s), alpha=False)
+            self.page_tk = ImageTk.PhotoImage(Image.frombytes("RGB", [pix.width, pix.height], pix.samples))
+            origin = (x0, y0)
+            self._clip = (self.current_page, s, region)
+        else:
+            pil = self._page_pil(self.current_page, self.scale)
+            display_w, display_h = pil.width, pil.height
+            self.page_tk = ImageTk.PhotoImage(pil)
+            self._tk_cache[key] = self.page_tk
+            if len(self._tk_cache) > TK_CACHE_MAX:
+                self._tk_cache.popitem(last=False)
+
+        # reuse the page image item; it was created first, so it stays below the rects
+        if self.canvas_image_id is None:
+            self.canvas_image_id = self.canvas.create_image(*origin, image=self.page_tk, anchor="nw")
+        else:
+            self.canvas.coords(self.canvas_image_id, *origin)
+            self.canvas.itemconfig(self.canvas_image_id, image=self.page_tk)
 
         # set scrollregion to full image size
         self.canvas.config(scrollregion=(0, 0, display_w, display_h))
 
-        # draw rectangles and labels scaled
-        self.canvas_rects = []
-        self.canvas_labels = []
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        for idx, para in enumerate(paras):
-            x0, y0, x1, y1 = para['bbox']
-            sx0, sy0, sx1, sy1 = (x0*self.scale, y0*self.scale, x1*self.scale, y1*self.scale)
-            rect = self.canvas.create_rectangle(sx0, sy0, sx1, sy1, outline="red", width=2, tags=("para_rect", f"p{idx}"))
-            label = self.canvas.create_text(sx0+4, sy0+2, text=f"P{para['number']}", anchor="nw", fill="blue", font=("Arial",10,"bold"), tags=("para_label", f"p{idx}"))
-            self.canvas_rects.append(rect)
-            self.canvas_labels.append(label)
+        self._draw_overlays(full=True)
+        self._request_cull()  # again once Tk has settled the view for the new scrollregion
 
         # re-draw selection & marker
         self.redraw_selection()
@@ -184,12 +360,79 @@ class PDFParaEditor:
             r = 4
             self.split_marker = self.canvas.create_oval(lx-r, ly-r, lx+r, ly+r, fill="yellow")
 
+    def _draw_overlays(self, full):
+        # draw rectangles and labels scaled, only for paragraphs that intersect
+        # the viewport; slot idx always holds paragraph idx, so its "p{idx}" tag
+        # stays right. full=False (scrolling) leaves already shown slots alone.
+        paras = self._get_paras(self.current_page)
+        vx0, vy0 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        vx1, vy1 = vx0 + self.canvas.winfo_width(), vy0 + self.canvas.winfo_height()
+        missing = len(paras) - len(self._rect_pool)
+        if missing > 0:
+            self._rect_pool.extend([None] * missing)
+            self._label_pool.extend([None] * missing)
+        boxes = scale_bboxes(self._page_bbox_cols(self.current_page), self.scale)
+        for idx, (para, (sx0, sy0, sx1, sy1)) in enumerate(zip(paras, boxes)):
+            rect, label = self._rect_pool[idx], self._label_pool[idx]
+            if sx1 < vx0 or sx0 > vx1 or sy1 < vy0 or sy0 > vy1:
+                if idx in self._shown:
+                    self.canvas.itemconfig(rect, state="hidden")
+                    self.canvas.itemconfig(label, state="hidden")
+                    self._shown.discard(idx)
+                continue
+            if rect is None:
+                sel = idx in self.selected_indices
+                rect = self.canvas.create_rectangle(sx0, sy0, sx1, sy1, outline="blue" if sel else "red", width=3 if sel else 2, tags=("para_rect", f"p{idx}"))
+                label = self.canvas.create_text(sx0+4, sy0+2, text=f"P{para['number']}", anchor="nw", fill="blue", font=("Arial",10,"bold"), tags=("para_label", f"p{idx}"))
+                self._rect_pool[idx], self._label_pool[idx] = rect, label
+            elif full or idx not in self._shown:
+                self.canvas.coords(rect, sx0, sy0, sx1, sy1)
+                self.canvas.coords(label, sx0+4, sy0+2)
+                self.canvas.itemconfig(rect, state="normal")
+                self.canvas.itemconfig(label, text=f"P{para['number']}", state="normal")
+            self._shown.add(idx)
+        # leftover slots from a busier page are hidden, not deleted
+        for idx in [i for i in self._shown if i >= len(paras)]:
+            self.canvas.itemconfig(self._rect_pool[idx], state="hidden")
+            self.canvas.itemconfig(self._label_pool[idx], state="hidden")
+            self._shown.discard(idx)
+        self.canvas_rects = self._rect_pool[:len(paras)]
+        self.canvas_labels = self._label_pool[:len(paras)]
+
+    def _request_cull(self):
+        # the viewport moved: show newly visible paragraphs once per frame
+        if not self._pending_cull:
+            self._pending_cull = True
+            self.master.after(16, self._flush_cull)
+
+    def _flush_cull(self):
+        self._pending_cull = False
+        if not self.doc:
+            return
+        if self._clip_stale():
+            self._render_scaled()
+        else:
+            self._draw_overlays(full=False)
+
+    def on_xscroll(self, *args):
+        self.canvas.xview(*args)
+        self._request_cull()
+
+    def on_yscroll(self, *args):
+        self.canvas.yview(*args)
+        self._request_cull()
+
     # ---------- Update HTML Preview ----------
     def update_html_preview(self):
+        # the pane only changes with the page's paragraph list; when that same
+        # list is already shown (zoom, scroll, redraw) there is nothing to do
+        paras = self._get_paras(self.current_page)
+        if paras is self._html_paras:
+            return
+        buf = "".join(f"<p id='p{para['number']}'>{para['text']}</p>\n" for para in paras)
         self.html_preview.delete("1.0","end")
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        for para in paras:
-            self.html_preview.insert("end", f"<p id='p{para['number']}'>{para['text']}</p>\n")
+        self.html_preview.insert("1.0", buf)
+        self._html_paras = paras
 
     # ---------- Map event coords back to original PDF coordinates ----------
     def canvas_to_pdf_coords(self, canvas_x, canvas_y):
@@ -208,12 +451,7 @@ class PDFParaEditor:
             return
         # map click to pdf coords
         px, py = self.canvas_to_pdf_coords(event.x, event.y)
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        clicked_idx = None
-        for idx, para in enumerate(paras):
-            if bbox_contains(para['bbox'], px, py):
-                clicked_idx = idx
-                break
+        clicked_idx = self.para_at(px, py)
         if clicked_idx is None:
             return
         ctrl = (event.state & 0x0004) != 0
@@ -225,11 +463,48 @@ class PDFParaEditor:
         else:
             self.selected_indices = {clicked_idx}
         self.redraw_selection()
-        self.update_html_preview()
+
+    def para_at(self, px, py):
+        # first paragraph (in list order) whose bbox holds the PDF point
+        paras = self._get_paras(self.current_page)
+        if len(paras) < GRID_MIN_PARAS:
+            candidates = range(len(paras))
+        else:
+            grid = self._para_grid.get(self.current_page)
+            if grid is None:
+                grid = self._para_grid[self.current_page] = self._build_para_grid(paras)
+            candidates = grid.get((int(px // GRID_CELL), int(py // GRID_CELL)), ())
+        x0s, y0s, x1s, y1s = self._page_bbox_cols(self.current_page)
+        for idx in candidates:
+            if x0s[idx] <= px <= x1s[idx] and y0s[idx] <= py <= y1s[idx]:
+                return idx
+        return None
+
+    def _page_bbox_cols(self, pno):
+        cols = self._bbox_cols.get(pno)
+        if cols is None:
+            cols = self._bbox_cols[pno] = bbox_columns(self._get_paras(pno))
+        return cols
+
+    def _drop_layout(self, pno):
+        # paragraph order on pno changed: lookup grid and box columns are stale
+        self._para_grid.pop(pno, None)
+        self._bbox_cols.pop(pno, None)
+
+    def _build_para_grid(self, paras):
+        grid = {}
+        for idx, para in enumerate(paras):
+            x0, y0, x1, y1 = para['bbox']
+            for cx in range(int(x0 // GRID_CELL), int(x1 // GRID_CELL) + 1):
+                for cy in range(int(y0 // GRID_CELL), int(y1 // GRID_CELL) + 1):
+                    grid.setdefault((cx, cy), []).append(idx)
+        return grid
 
     def redraw_selection(self):
         # update rect outlines according to selection, keep positions scaled
         for idx, rect in enumerate(self.canvas_rects):
+            if rect is None:
+                continue  # never scrolled into view yet; created with the right color
             color = "blue" if idx in self.selected_indices else "red"
             width = 3 if idx in self.selected_indices else 2
             try:
@@ -243,12 +518,7 @@ class PDFParaEditor:
             return
         # map to pdf coords
         px, py = self.canvas_to_pdf_coords(event.x, event.y)
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        clicked_idx = None
-        for idx, para in enumerate(paras):
-            if bbox_contains(para['bbox'], px, py):
-                clicked_idx = idx
-                break
+        clicked_idx = self.para_at(px, py)
         if clicked_idx is None:
             messagebox.showinfo("Split", "Right-click inside paragraph to set split point.")
             return
@@ -263,33 +533,39 @@ class PDFParaEditor:
         self.split_marker = self.canvas.create_oval(sx-r, sy-r, sx+r, sy+r, fill="yellow")
 
     # ---------- Swap block positions (move up/down) ----------
-    def push_undo(self):
-        # store shallow copy of structure (deepcopy paragraphs_by_page to be safe)
-        self.undo_stack.append(copy.deepcopy(self.paragraphs_by_page))
+    def push_undo(self, pno):
+        # only page pno is about to change; copy its paragraph dicts (a swap
+        # renumbers them in place) but share the immutable bbox inside
+        self.undo_stack.append((pno, [dict(p) for p in self._get_paras(pno)]))
 
     def ctrl_up(self, event):
-        paras = self.paragraphs_by_page.get(self.current_page, [])
+        paras = self._get_paras(self.current_page)
         if len(self.selected_indices) != 1:
             return
         idx = next(iter(self.selected_indices))
         if idx == 0:
             return
-        self.push_undo()
+        self.push_undo(self.current_page)
+        self._drop_layout(self.current_page)
         paras[idx - 1], paras[idx] = paras[idx], paras[idx - 1]
-        for i, p in enumerate(paras): p['number'] = i + 1
+        # number is always position + 1, so only the swapped pair changes
+        paras[idx - 1]['number'], paras[idx]['number'] = idx, idx + 1
+        self._html_paras = None
         self.selected_indices = {idx - 1}
         self.show_page()
 
     def ctrl_down(self, event):
-        paras = self.paragraphs_by_page.get(self.current_page, [])
+        paras = self._get_paras(self.current_page)
         if len(self.selected_indices) != 1:
             return
         idx = next(iter(self.selected_indices))
         if idx >= len(paras) - 1:
             return
-        self.push_undo()
+        self.push_undo(self.current_page)
+        self._drop_layout(self.current_page)
         paras[idx], paras[idx + 1] = paras[idx + 1], paras[idx]
-        for i, p in enumerate(paras): p['number'] = i + 1
+        paras[idx]['number'], paras[idx + 1]['number'] = idx + 1, idx + 2
+        self._html_paras = None
         self.selected_indices = {idx + 1}
         self.show_page()
 
@@ -317,34 +593,38 @@ class PDFParaEditor:
 
     # ---------- Save JSON ----------
     def save_paratag(self):
-        if not self.paragraphs_by_page: return
+        if not self.doc: return
         out = filedialog.asksaveasfilename(defaultextension=".json",filetypes=[("JSON","*.json")])
         if not out: return
-        data = {}
-        for pno,paras in self.paragraphs_by_page.items():
-            lst = []
-            for para in paras:
-                x0,y0,x1,y1 = para['bbox']
-                lst.append({'x1':x0,'y1':y0,'x2':x1,'y2':y1,'text':para['text'], 'number': para['number']})
-            data[f"page_{pno+1}"] = lst
+        # one page at a time: each page is dumped as a one-key object and its
+        # braces are dropped, so the file matches a json.dump of the whole dict
         with open(out,"w",encoding="utf-8") as f:
-            json.dump(data,f,indent=2,ensure_ascii=False)
+            sep = "{\n"
+            for pno,paras in self._get_all_paras():
+                lst = []
+                for para in paras:
+                    x0,y0,x1,y1 = para['bbox']
+                    lst.append({'x1':x0,'y1':y0,'x2':x1,'y2':y1,'text':para['text'], 'number': para['number']})
+                f.write(sep)
+                f.write(json.dumps({f"page_{pno+1}": lst},indent=2,ensure_ascii=False)[2:-2])
+                sep = ",\n"
+            f.write("\n}")
         messagebox.showinfo("Saved","Paragraph tags saved.")
 
     # ---------- Export HTML ----------
     def export_html(self):
-        if not self.paragraphs_by_page: return
+        if not self.doc: return
         out = filedialog.asksaveasfilename(defaultextension=".html",filetypes=[("HTML","*.html")])
         if not out: return
-        lines = ["<!doctype html>","<html><head><meta charset='utf-8'></head><body>"]
-        for pno,paras in sorted(self.paragraphs_by_page.items()):
-            paras_sorted = sorted(paras, key=lambda p: p['number'])
-            for para in paras_sorted:
-                txt = para['text'].replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
-                lines.append(f"<p id='p{para['number']}'>{txt}</p>")
-        lines.append("</body></html>")
+        # written as it is generated; nothing page-sized is held in memory
         with open(out,"w",encoding="utf-8") as f:
-            f.write("\n".join(lines))
+            f.write("<!doctype html>\n<html><head><meta charset='utf-8'></head><body>")
+            for pno,paras in self._get_all_paras():
+                paras_sorted = sorted(paras, key=lambda p: p['number'])
+                for para in paras_sorted:
+                    txt = para['text'].translate(HTML_ESCAPE)
+                    f.write(f"\n<p id='p{para['number']}'>{txt}</p>")
+            f.write("\n</body></html>")
         messagebox.showinfo("Exported","HTML exported.")
 
     # ---------- Save PDF ----------
@@ -356,7 +636,8 @@ class PDFParaEditor:
         if not out:
             return
         try:
-            self.doc.save(out, incremental=False, encryption=fitz.PDF_ENCRYPT_KEEP)
+            with self._lock:
+                self.doc.save(out, incremental=False, encryption=fitz.PDF_ENCRYPT_KEEP)
             messagebox.showinfo("Saved", f"PDF saved successfully to:\n{out}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save PDF:\n{e}")
@@ -365,7 +646,9 @@ class PDFParaEditor:
     def on_undo(self, event=None):
         if not self.undo_stack:
             return
-        self.paragraphs_by_page = self.undo_stack.pop()
+        pno, paras = self.undo_stack.pop()
+        self.paragraphs_by_page[pno] = paras
+        self._drop_layout(pno)
         self.show_page()
 
     # ---------- Zoom / Fit / Scroll handling ----------
@@ -374,13 +657,27 @@ class PDFParaEditor:
         new_scale = max(self.min_scale, min(self.max_scale, self.scale * factor))
         if abs(new_scale - self.scale) < 1e-6:
             return
-        # optionally keep center point stable
-        if center is None:
-            # use canvas center in canvas coords
-            center = (self.canvas.winfo_width()//2, self.canvas.winfo_height()//2)
-        # map center to PDF coords before scale
-        pdf_cx, pdf_cy = self.canvas_to_pdf_coords(center[0], center[1])
+        # optionally keep center point stable; within one burst of zoom
+        # steps the anchor is taken once, while the canvas still matches self.scale
+        if self._zoom_anchor is None:
+            if center is None:
+                # use canvas center in canvas coords
+                center = (self.canvas.winfo_width()//2, self.canvas.winfo_height()//2)
+            # map center to PDF coords before scale
+            self._zoom_anchor = self.canvas_to_pdf_coords(center[0], center[1])
         self.scale = new_scale
+        self._request_redraw()
+
+    def _request_redraw(self):
+        # wheel ticks only move self.scale; one redraw renders the final value
+        if not self._pending_redraw:
+            self._pending_redraw = True
+            self.master.after(16, self._flush_redraw)
+
+    def _flush_redraw(self):
+        self._pending_redraw = False
+        pdf_cx, pdf_cy = self._zoom_anchor
+        self._zoom_anchor = None
         self.show_page()
         # after redraw, scroll so the pdf_cx,pdf_cy remains at center
         # map pdf coords to canvas coords after scaling:
@@ -391,18 +688,20 @@ class PDFParaEditor:
         canvas_height = self.canvas.winfo_height()
         tx = new_canvas_cx - canvas_width//2
         ty = new_canvas_cy - canvas_height//2
-        self.canvas.xview_moveto(max(0, tx) / max(1, self.canvas.bbox("all")[2]))
-        self.canvas.yview_moveto(max(0, ty) / max(1, self.canvas.bbox("all")[3]))
+        display_w, display_h = self._page_extent()
+        self.canvas.xview_moveto(max(0, tx) / display_w)
+        self.canvas.yview_moveto(max(0, ty) / display_h)
+        self._request_cull()
 
     def fit_width(self):
-        if not self.page_pil:
+        if not self.page_size:
             return
         canvas_w = self.canvas.winfo_width()
         if canvas_w <= 1:
             # canvas not yet laid out; try later
             self.master.after(100, self.fit_width)
             return
-        new_scale = canvas_w / self.page_pil.width
+        new_scale = canvas_w / self.page_size[0]
         # clamp
         new_scale = max(self.min_scale, min(self.max_scale, new_scale))
         self.scale = new_scale
@@ -410,18 +709,30 @@ class PDFParaEditor:
         # reset scroll to left/top
         self.canvas.xview_moveto(0)
         self.canvas.yview_moveto(0)
+        self._request_cull()
 
     def on_canvas_configure(self, event):
         # optionally keep fit-to-width behavior? we won't auto-fit every resize,
         # but if scale was previously set by fit_width and we want to maintain,
         # user can press Fit Width again. For now, just ensure scrollregion is OK.
         if self.page_tk:
-            self.canvas.config(scrollregion=self.canvas.bbox("all"))
+            self.canvas.config(scrollregion=(0, 0, *self._page_extent()))
+            self._request_cull()
+
+    def _finish_zoom(self):
+        self._zooming_after_id = None
+        self._interactive = False
+        self.show_page()
 
     def on_mousewheel(self, event):
         # Ctrl + wheel => zoom
         ctrl = (event.state & 0x0004) != 0
         if ctrl:
+            # fast filter while the wheel is moving; sharp redraw once it stops
+            self._interactive = True
+            if self._zooming_after_id:
+                self.master.after_cancel(self._zooming_after_id)
+            self._zooming_after_id = self.master.after(ZOOM_SETTLE_MS, self._finish_zoom)
             # get mouse pos relative to canvas to use as zoom center
             mx, my = event.x, event.y
             delta = 0
@@ -447,6 +758,7 @@ class PDFParaEditor:
                 self.canvas.xview_scroll(move, "units")
             else:
                 self.canvas.yview_scroll(move, "units")
+            self._request_cull()
 
 # ---------- Run ----------
 if __name__=="__main__":
@@ -2,15 +2,34 @@ import fitz
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
-import copy
-import math
 import json
+import os
+import hashlib
+import zlib
+import threading
+import queue
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PIX_CACHE_MAX = 8   # rendered PhotoImages kept per (page, zoom), most recently used last
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "pdf_to_html")
+CACHE_VERSION = 2   # bump when the cached paragraph/pixmap layout changes
+CACHE_MAX_BYTES = 512 << 20   # whole disk cache; least recently used files are pruned first
+CACHE_LEVEL = 1     # zlib level: fast; the point is skipping MuPDF, not small files
+DRAFT_ZOOM = 0.3    # above this zoom a quick draft is shown while the full render runs
+DRAFT_CACHE_MAX = 16   # pages whose draft source is kept
+RESULT_POLL_MS = 30    # how often Tk collects finished background renders
+EXPORT_BUFFER = 1 << 20   # export_html write buffer
+HTML_PREVIEW_DELAY_MS = 100   # quiet time before the HTML pane is rebuilt
+GRID_CELL = 64      # PDF units per click-lookup grid cell
+GRID_MIN_PARAS = 32 # pages with fewer paragraphs are just scanned
+
+# one-pass escaping for export_html (same output as chained &, <, > replaces)
+HTML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
 
 # ---------- Helper functions ----------
-def bbox_contains(bbox, x, y):
-    x0, y0, x1, y1 = bbox
-    return x0 <= x <= x1 and y0 <= y <= y1
-
 def bbox_merge(b1, b2):
     x0 = min(b1[0], b2[0])
     y0 = min(b1[1], b2[1])
@@ -18,23 +37,144 @@ def bbox_merge(b1, b2):
     y1 = max(b1[3], b2[3])
     return (x0, y0, x1, y1)
 
-def words_in_bbox(words, bbox):
-    x0, y0, x1, y1 = bbox
-    inside = [w for w in words if w[0] >= x0-0.1 and w[2] <= x1+0.1 and w[1] >= y0-0.1 and w[3] <= y1+0.1]
-    inside_sorted = sorted(inside, key=lambda w: (w[1], w[0]))
-    return inside_sorted
+def index_words(words):
+    # page words sorted by (y0, x0) once, plus their coordinate columns:
+    # y0 for bisecting, x0/x1/y1 for the containment test
+    ws = sorted(words, key=lambda w: (w[1], w[0]))
+    if not ws:
+        return ws, [], [], [], []
+    x0s, y0s, x1s, y1s = (list(col) for col in list(zip(*ws))[:4])
+    return ws, y0s, x0s, x1s, y1s
+
+def words_in_bbox(word_index, bbox):
+    # only the y0 window [y0, y1] is scanned; it is already in reading order.
+    # Bounds are widened once per call, and the window is tested column-wise.
+    ws, y0s, x0s, x1s, y1s = word_index
+    xmin, ymin, xmax, ymax = bbox[0]-0.1, bbox[1]-0.1, bbox[2]+0.1, bbox[3]+0.1
+    lo = bisect_left(y0s, ymin)
+    hi = bisect_right(y0s, ymax)
+    return [w for w, a, b, c in zip(ws[lo:hi], x0s[lo:hi], x1s[lo:hi], y1s[lo:hi])
+            if a >= xmin and b <= xmax and c <= ymax]
+
+def bbox_columns(paras):
+    # a page's boxes column-wise: (x0s, y0s, x1s, y1s) as flat double arrays
+    if not paras:
+        return tuple(array('d') for _ in range(4))
+    return tuple(array('d', col) for col in zip(*[p['bbox'] for p in paras]))
+
+def build_para_grid(paras):
+    # {(cx, cy): [para idx, ...]} over GRID_CELL cells, indices in list order
+    grid = {}
+    for idx, para in enumerate(paras):
+        x0, y0, x1, y1 = para['bbox']
+        for cx in range(int(x0 // GRID_CELL), int(x1 // GRID_CELL) + 1):
+            for cy in range(int(y0 // GRID_CELL), int(y1 // GRID_CELL) + 1):
+                grid.setdefault((cx, cy), []).append(idx)
+    return grid
+
+def words_bbox(words):
+    # union bbox of word tuples: transpose once, then four C-level min/max
+    x0s, y0s, x1s, y1s = list(zip(*words))[:4]
+    return (min(x0s), min(y0s), max(x1s), max(y1s))
 
 def nearest_word_index(words_list, click_x, click_y):
-    best_i = None
-    best_d = None
-    for i, w in enumerate(words_list):
-        cx = (w[0] + w[2]) / 2.0
-        cy = (w[1] + w[3]) / 2.0
-        d = math.hypot(cx - click_x, cy - click_y)
-        if best_d is None or d < best_d:
-            best_d = d
-            best_i = i
-    return best_i
+    # ranking only needs squared distance, and doubling the click avoids
+    # halving every word centre; d.index(min(d)) keeps the first closest word
+    if not words_list:
+        return None
+    cx2, cy2 = 2 * click_x, 2 * click_y
+    d = [(w[0] + w[2] - cx2) ** 2 + (w[1] + w[3] - cy2) ** 2 for w in words_list]
+    return d.index(min(d))
+
+# ---------- Disk cache ----------
+# one writer thread, so saving renders/paragraphs never blocks the UI
+_CACHE_WRITER = ThreadPoolExecutor(max_workers=1)
+_cache_written = 0   # bytes written since the last prune; writer thread only
+
+def cache_dir_for(path):
+    # keyed by the file's first MiB, its size and its mtime: cheap even for huge
+    # PDFs, and an edit past the first MiB that keeps the size still changes mtime
+    st = os.stat(path)
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(1 << 20))
+    h.update(b"%d %d" % (st.st_size, st.st_mtime_ns))
+    return os.path.join(CACHE_ROOT, f"v{CACHE_VERSION}", h.hexdigest())
+
+def read_cache(cache_dir, name):
+    if not cache_dir:
+        return None
+    target = os.path.join(cache_dir, name)
+    try:
+        with open(target, "rb") as f:
+            data = zlib.decompress(f.read())
+        os.utime(target)  # mtime doubles as last use for pruning
+        return data
+    except (OSError, zlib.error):
+        return None
+
+def _prune_cache():
+    # writer thread: drop the least recently used files until the cache fits
+    files = []
+    for dirpath, _, names in os.walk(CACHE_ROOT):
+        for name in names:
+            p = os.path.join(dirpath, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in files)
+    for _, size, p in sorted(files):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(p)
+        except OSError:
+            continue  # in use (Windows) or already gone
+        total -= size
+
+def prune_cache():
+    _CACHE_WRITER.submit(_prune_cache)
+
+def _write_cache(cache_dir, name, chunks):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        target = os.path.join(cache_dir, name)
+        z = zlib.compressobj(CACHE_LEVEL)
+        with open(target + ".tmp", "wb") as f:
+            for chunk in chunks:
+                f.write(z.compress(chunk))
+            f.write(z.flush())
+            size = f.tell()
+        os.replace(target + ".tmp", target)  # readers never see a partial file
+    except OSError:
+        return  # the cache is only an accelerator
+    # a long session is pruned again after every eighth of the cap written
+    global _cache_written
+    _cache_written += size
+    if _cache_written > CACHE_MAX_BYTES // 8:
+        _cache_written = 0
+        _prune_cache()
+
+def write_cache(cache_dir, name, *chunks):
+    if cache_dir:
+        _CACHE_WRITER.submit(_write_cache, cache_dir, name, chunks)
+
+def _write_pix_cache(cache_dir, name, pix):
+    _write_cache(cache_dir, name, (b"%d %d\n" % (pix.width, pix.height), pix.samples_mv))
+
+def write_pix_cache(cache_dir, name, pix):
+    # "<w> <h>\n" + samples, compressed straight from the pixmap. Pixmap.__del__
+    # releases samples_mv, so the job holds pix itself until the write is done
+    if cache_dir:
+        _CACHE_WRITER.submit(_write_pix_cache, cache_dir, name, pix)
+
+def pix_image(pix):
+    # PIL view of the pixmap's own sample buffer, no copy. The view does not
+    # keep pix alive: callers hold pix until the image is copied into Tk
+    mode = "L" if pix.n == 1 else "RGB"
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, 0, 1)
 
 # ---------- Main App ----------
 class PDFParaEditor:
@@ -45,11 +185,27 @@ class PDFParaEditor:
         self.doc = None
         self.current_page = 0
         self.paragraphs_by_page = {}
+        self._para_grid = {}   # page -> build_para_grid(); dropped whenever that page's paragraphs change
+        self._scaled_bboxes = {}   # (page, zoom) -> [scaled bbox, ...]; dropped with the grid
+        self._page_bboxes = {}     # page -> bbox_columns() for hit-testing; dropped with the grid
         self.selected_indices = set()
-        self.undo_stack = []
+        self.undo_stack = []   # [(page, that page's paragraph list before the edit), ...]
         self.last_right_click = None   # stored in UN-SCALED (original PDF) coords
         self.split_marker = None
         self.page_pix_image = None
+        self._pix_cache = OrderedDict()   # (page, zoom) -> PhotoImage; edits are canvas items, so only a new PDF invalidates it
+        self._cache_dir = None            # on-disk cache of parsed paragraphs and renders for this PDF
+        # pages are parsed on first use; a worker parses the neighbours ahead.
+        # fitz is not thread-safe, so every fitz call holds _lock
+        self._lock = threading.RLock()
+        self._prefetch = ThreadPoolExecutor(max_workers=1)
+        self._render_exec = ThreadPoolExecutor(max_workers=1)
+        self._hires_futs = {}         # (page, zoom) -> Future of its full render
+        self._results = queue.Queue() # finished renders; only the Tk thread takes them out
+        self._polling = False         # _poll_results is scheduled
+        self._draft_src = OrderedDict()   # page -> (page rect, gray PIL render at DRAFT_ZOOM)
+        self._draft = None            # (key, PhotoImage) placeholder shown until that render lands
+        self.page_image_id = None
 
         # Zoom (scale)
         self.zoom = 0.6  # default 60% size; change as needed
@@ -114,77 +270,283 @@ class PDFParaEditor:
         self.goto_btn = tk.Button(top_bar2, text="•", command=self.goto_page_button)
         self.goto_btn.pack(side="left")
 
-        # internal storage for drawn rect ids
+        # internal storage for drawn rect ids, reused across redraws
         self.canvas_rects = []
+        self._label_ids = []
+        self._drawn_boxes = []   # scaled bbox each slot was last drawn at
+        self._show_pending = False
+        self._html_after = None   # pending update_html_preview callback
+        self._drawn_selected = set()   # selection the rect outlines currently show
 
     # ---------- Open PDF ----------
     def open_pdf(self):
         path = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
         if not path:
             return
-        try:
-            self.doc = fitz.open(path)
-        except Exception as e:
-            messagebox.showerror("Error", f"Cannot open PDF: {e}")
-            return
+        with self._lock:
+            try:
+                self.doc = fitz.open(path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Cannot open PDF: {e}")
+                return
 
-        self.paragraphs_by_page.clear()
-        self.current_page = 0
-        for pno in range(len(self.doc)):
-            page = self.doc.load_page(pno)
-            blocks = page.get_text("blocks")
-            words = page.get_text("words")
-            paras = []
-            for b in blocks:
-                x0, y0, x1, y1, text = b[0], b[1], b[2], b[3], b[4]
-                w_in = words_in_bbox(words, (x0, y0, x1, y1))
-                paras.append({'bbox': (x0, y0, x1, y1), 'text': text.strip(), 'words': w_in})
-            self.paragraphs_by_page[pno] = paras
+            self.paragraphs_by_page.clear()
+            self._para_grid.clear()
+            self._scaled_bboxes.clear()
+            self._page_bboxes.clear()
+            self._pix_cache.clear()
+            for fut in self._hires_futs.values():
+                fut.cancel()
+            self._hires_futs.clear()
+            self._draft_src.clear()
+            self._draft = None
+            try:
+                self._cache_dir = cache_dir_for(path)
+            except OSError:
+                self._cache_dir = None
+            prune_cache()
+            self.current_page = 0
         self.show_page()
 
+    def _get_paras(self, pno):
+        paras = self.paragraphs_by_page.get(pno)
+        if paras is None:
+            with self._lock:
+                paras = self.paragraphs_by_page.get(pno)
+                if paras is None:
+                    paras = self.paragraphs_by_page[pno] = self._load_page_paras(pno)
+        return paras
+
+    def _get_all_paras(self):
+        # exports cover every page, so parse whatever has not been viewed yet
+        return [(pno, self._get_paras(pno)) for pno in range(len(self.doc))]
+
+    def _load_page_paras(self, pno):
+        # a warm start reads the paragraphs parsed last time this PDF was opened
+        name = f"paras_{pno}.json.z"
+        cached = read_cache(self._cache_dir, name)
+        if cached is not None:
+            return [{'bbox': tuple(p['bbox']), 'text': p['text'], 'words': [tuple(w) for w in p['words']]}
+                    for p in json.loads(cached)]
+        page = self.doc.load_page(pno)
+        blocks = page.get_text("blocks")
+        # keep (x0, y0, x1, y1, text); block/line/word numbers are never read
+        words = index_words([w[:5] for w in page.get_text("words")])
+        paras = []
+        for b in blocks:
+            x0, y0, x1, y1, text = b[0], b[1], b[2], b[3], b[4]
+            w_in = words_in_bbox(words, (x0, y0, x1, y1))
+            paras.append({'bbox': (x0, y0, x1, y1), 'text': text.strip(), 'words': w_in})
+        # serialized now, before any edit can touch these dicts
+        write_cache(self._cache_dir, name, json.dumps(paras, ensure_ascii=False).encode("utf-8"))
+        return paras
+
     # ---------- Show Page ----------
     def show_page(self):
+        # calls in a row (split then messagebox, undo bursts) collapse into
+        # one redraw once Tk is idle
+        if not self._show_pending:
+            self._show_pending = True
+            self.master.after_idle(self._show_page_now)
+
+    def _show_page_now(self):
+        self._show_pending = False
         if not self.doc:
             return
-        page = self.doc.load_page(self.current_page)
-
-        # render with zoom (scale) matrix
-        zoom_matrix = fitz.Matrix(self.zoom, self.zoom)
-        pix = page.get_pixmap(matrix=zoom_matrix)
-
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        self.page_pix_image = ImageTk.PhotoImage(img)
-
-        # clear canvas and set scrollregion
-        self.canvas.delete("all")
-        self.canvas.config(scrollregion=(0, 0, pix.width, pix.height))
-        self.canvas.create_image(0, 0, image=self.page_pix_image, anchor="nw")
-
-        # draw paragraph boxes (scale bbox coordinates for display)
-        self.canvas_rects = []
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        for idx, para in enumerate(paras):
-            x0, y0, x1, y1 = para['bbox']
+        self.draw_page_image()
+        self.draw_paragraphs()
+        self.redraw_selection()
+        self.schedule_html_preview()
+        self.page_label.config(text=f"Page {self.current_page+1} / {len(self.doc)}")
+        self.zoom_label.config(text=f"{int(self.zoom*100)}%")
+        # so next_page/prev_page find their paragraphs ready
+        for pno in (self.current_page + 1, self.current_page - 1):
+            if 0 <= pno < len(self.doc) and pno not in self.paragraphs_by_page:
+                self._prefetch.submit(self._get_paras, pno)
+
+    def draw_page_image(self):
+        # split/merge/undo redraw the same page at the same zoom: reuse that render
+        key = (self.current_page, round(self.zoom, 3))
+        self.page_pix_image = self._pix_cache.get(key)
+        if self.page_pix_image is not None:
+            self._pix_cache.move_to_end(key)
+        else:
+            # then the disk cache: "<w> <h>\n" followed by the RGB samples
+            name = f"page_{key[0]}_z{key[1]}.raw.z"
+            cached = read_cache(self._cache_dir, name)
+            if cached is not None:
+                split = cached.index(b"\n")
+                w, h = map(int, cached[:split].split())
+                samples = memoryview(cached)[split+1:]
+                self._cache_photo(key, Image.frombuffer("RGB", (w, h), samples, "raw", "RGB", 0, 1))
+            elif self.zoom <= DRAFT_ZOOM:
+                # small enough to render right away
+                pix = self._render_pix(self.current_page, self.zoom)
+                write_pix_cache(self._cache_dir, name, pix)
+                self._cache_photo(key, pix_image(pix))
+            else:
+                # show a coarse draft now; the full render replaces it when ready
+                if self._draft is None or self._draft[0] != key:
+                    rect, src = self._draft_source(self.current_page)
+                    size = (rect * fitz.Matrix(self.zoom, self.zoom)).irect
+                    draft = src.resize((size.width, size.height), Image.NEAREST)
+                    self._draft = (key, ImageTk.PhotoImage(draft))
+                self.page_pix_image = self._draft[1]
+                self._request_hires(key)
+
+        # set scrollregion; the page image item is created once and reused
+        if self.split_marker:
+            self.canvas.delete(self.split_marker)
+            self.split_marker = None
+        self.canvas.config(scrollregion=(0, 0, self.page_pix_image.width(), self.page_pix_image.height()))
+        if self.page_image_id is None:
+            self.page_image_id = self.canvas.create_image(0, 0, image=self.page_pix_image, anchor="nw")
+        else:
+            self.canvas.itemconfig(self.page_image_id, image=self.page_pix_image)
+
+    def _draft_source(self, pno):
+        # the draft is on screen only briefly: 1 byte/pixel gray is enough. It is
+        # kept per page, so later zoom steps draft without fitz and never wait on
+        # _lock behind a full render that is still running
+        src = self._draft_src.get(pno)
+        if src is not None:
+            self._draft_src.move_to_end(pno)
+            return src
+        with self._lock:
+            rect = self.doc.load_page(pno).rect
+        pix = self._render_pix(pno, DRAFT_ZOOM, fitz.csGRAY)
+        src = self._draft_src[pno] = (rect, pix_image(pix).copy())   # outlives pix
+        if len(self._draft_src) > DRAFT_CACHE_MAX:
+            self._draft_src.popitem(last=False)
+        return src
+
+    def _request_hires(self, key):
+        # queued renders for keys no longer shown are dropped; the one already
+        # running cannot be stopped and just lands in the cache
+        for k, fut in list(self._hires_futs.items()):
+            if k != key and fut.cancel():
+                del self._hires_futs[k]
+        if key in self._hires_futs:
+            return
+        doc, cache_dir = self.doc, self._cache_dir
+        fut = self._hires_futs[key] = self._render_exec.submit(self._render_pix, key[0], self.zoom)
+        # runs on the render thread, so it only queues the result for _poll_results
+        fut.add_done_callback(lambda f: self._results.put((doc, cache_dir, key, f)))
+        if not self._polling:
+            self._polling = True
+            self.master.after(RESULT_POLL_MS, self._poll_results)
+
+    def _poll_results(self):
+        # UI thread: apply the renders finished since the last poll
+        while True:
+            try:
+                item = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._on_hires(*item)
+        if self._hires_futs:
+            self.master.after(RESULT_POLL_MS, self._poll_results)
+        else:
+            self._polling = False
 
-            # scale coordinates for display
-            sx0, sy0 = x0 * self.zoom, y0 * self.zoom
-            sx1, sy1 = x1 * self.zoom, y1 * self.zoom
+    def _render_pix(self, pno, zoom, colorspace=fitz.csRGB):
+        # runs on the UI or the render thread; always 3 (or, for gray, 1)
+        # bytes per pixel with no alpha plane
+        with self._lock:
+            page = self.doc.load_page(pno)
 
+            # render with zoom (scale) matrix
+            zoom_matrix = fitz.Matrix(zoom, zoom)
+            return page.get_pixmap(matrix=zoom_matrix, colorspace=colorspace, alpha=False)
+
+    def _cache_photo(self, key, img):
+        # pages of one PDF mostly share a size per zoom, so the entry that falls
+        # out of the LRU usually takes the new pixels in place of a new Tk image
+        photo = None
+        if len(self._pix_cache) >= PIX_CACHE_MAX:
+            _, old = self._pix_cache.popitem(last=False)
+            if old is not self.page_pix_image and (old.width(), old.height()) == img.size:
+                old.paste(img)
+                photo = old
+        if photo is None:
+            photo = ImageTk.PhotoImage(img)
+        self.page_pix_image = self._pix_cache[key] = photo
+
+    def _on_hires(self, doc, cache_dir, key, fut):
+        # UI thread: the full-zoom render of key finished (or was cancelled)
+        if self._hires_futs.get(key) is fut:
+            del self._hires_futs[key]
+        if doc is not self.doc or fut.cancelled():
+            return  # a different PDF was opened meanwhile, or the user moved on
+        try:
+            pix = fut.result()
+        except Exception:
+            return  # the draft stays; the next show_page tries again
+        write_pix_cache(cache_dir, f"page_{key[0]}_z{key[1]}.raw.z", pix)
+        shown = self.page_pix_image
+        self._cache_photo(key, pix_image(pix))
+        if key == (self.current_page, round(self.zoom, 3)):
+            self.canvas.itemconfig(self.page_image_id, image=self.page_pix_image)
+            self._draft = None
+        else:
+            self.page_pix_image = shown  # the user moved on; keep showing what is on screen
+
+    def draw_paragraphs(self):
+        # draw paragraph boxes (scale bbox coordinates for display). Slot idx
+        # keeps its rect/label across redraws (its label is always P{idx+1}):
+        # moved boxes get coords, only the count difference is created/deleted
+        boxes = self._page_scaled_bboxes()
+        n = len(boxes)
+        for idx in range(n, len(self.canvas_rects)):
+            self.canvas.delete(self.canvas_rects[idx], self._label_ids[idx])
+        del self.canvas_rects[n:], self._label_ids[n:], self._drawn_boxes[n:]
+        self._drawn_selected = {idx for idx in self._drawn_selected if idx < n}
+        for idx, (sx0, sy0, sx1, sy1) in enumerate(boxes):
+            if idx < len(self.canvas_rects):
+                if self._drawn_boxes[idx] != (sx0, sy0, sx1, sy1):
+                    self.canvas.coords(self.canvas_rects[idx], sx0, sy0, sx1, sy1)
+                    self.canvas.coords(self._label_ids[idx], sx0+4, sy0+2)
+                    self._drawn_boxes[idx] = (sx0, sy0, sx1, sy1)
+                continue
             rect = self.canvas.create_rectangle(sx0, sy0, sx1, sy1, outline="red", width=2)
             label = self.canvas.create_text(sx0+4, sy0+2, text=f"P{idx+1}", anchor="nw", fill="white", font=("Arial", 10, "bold"))
             self.canvas_rects.append(rect)
-
-        self.redraw_selection()
-        self.update_html_preview()
-        self.page_label.config(text=f"Page {self.current_page+1} / {len(self.doc)}")
-        self.zoom_label.config(text=f"{int(self.zoom*100)}%")
+            self._label_ids.append(label)
+            self._drawn_boxes.append((sx0, sy0, sx1, sy1))
+
+    def _page_scaled_bboxes(self):
+        # zoom rarely changes compared to redraws: scale a page's boxes once per zoom
+        key = (self.current_page, round(self.zoom, 3))
+        boxes = self._scaled_bboxes.get(key)
+        if boxes is None:
+            z = self.zoom
+            boxes = self._scaled_bboxes[key] = [(x0*z, y0*z, x1*z, y1*z)
+                                                for x0, y0, x1, y1 in [p['bbox'] for p in self._get_paras(self.current_page)]]
+        return boxes
+
+    def _drop_layout(self, pno):
+        # paragraphs on pno changed: its click grid and box caches are stale
+        self._para_grid.pop(pno, None)
+        self._page_bboxes.pop(pno, None)
+        for key in [k for k in self._scaled_bboxes if k[0] == pno]:
+            del self._scaled_bboxes[key]
 
     # ---------- HTML Preview ----------
+    def schedule_html_preview(self):
+        # bursts of edits and page flips rebuild the pane once, after they settle
+        if self._html_after:
+            self.master.after_cancel(self._html_after)
+        self._html_after = self.master.after(HTML_PREVIEW_DELAY_MS, self.update_html_preview)
+
     def update_html_preview(self):
+        self._html_after = None
+        if not self.doc:
+            return
+        # one Text insert for the whole page instead of one per paragraph
+        paras = self._get_paras(self.current_page)
+        buf = "".join(f"<p id='p{idx+1}'>{para['text']}</p>\n" for idx, para in enumerate(paras))
         self.html_preview.delete("1.0", "end")
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        for idx, para in enumerate(paras):
-            self.html_preview.insert("end", f"<p id='p{idx+1}'>{para['text']}</p>\n")
+        self.html_preview.insert("1.0", buf)
 
     # ---------- Selection ----------
     def on_canvas_left_click(self, event):
@@ -195,12 +557,7 @@ class PDFParaEditor:
         ux = self.canvas.canvasx(event.x) / self.zoom
         uy = self.canvas.canvasy(event.y) / self.zoom
 
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        clicked_idx = None
-        for idx, para in enumerate(paras):
-            if bbox_contains(para['bbox'], ux, uy):
-                clicked_idx = idx
-                break
+        clicked_idx = self.para_at(ux, uy)
         if clicked_idx is None:
             return
 
@@ -213,12 +570,34 @@ class PDFParaEditor:
         else:
             self.selected_indices = {clicked_idx}
         self.redraw_selection()
-        self.update_html_preview()
+
+    def para_at(self, ux, uy):
+        # first paragraph (in list order) whose bbox holds the PDF point
+        paras = self._get_paras(self.current_page)
+        if len(paras) < GRID_MIN_PARAS:
+            candidates = range(len(paras))
+        else:
+            grid = self._para_grid.get(self.current_page)
+            if grid is None:
+                grid = self._para_grid[self.current_page] = build_para_grid(paras)
+            candidates = grid.get((int(ux // GRID_CELL), int(uy // GRID_CELL)), ())
+        cols = self._page_bboxes.get(self.current_page)
+        if cols is None:
+            cols = self._page_bboxes[self.current_page] = bbox_columns(paras)
+        x0s, y0s, x1s, y1s = cols
+        for idx in candidates:
+            if x0s[idx] <= ux <= x1s[idx] and y0s[idx] <= uy <= y1s[idx]:
+                return idx
+        return None
 
     def redraw_selection(self):
-        for idx, rect in enumerate(self.canvas_rects):
-            color = "blue" if idx in self.selected_indices else "red"
-            self.canvas.itemconfig(rect, outline=color, width=3 if idx in self.selected_indices else 2)
+        # only rects whose selection state changed since the last call are touched
+        changed = self._drawn_selected ^ self.selected_indices
+        for idx in changed:
+            if idx < len(self.canvas_rects):
+                color = "blue" if idx in self.selected_indices else "red"
+                self.canvas.itemconfig(self.canvas_rects[idx], outline=color, width=3 if idx in self.selected_indices else 2)
+        self._drawn_selected = {idx for idx in self.selected_indices if idx < len(self.canvas_rects)}
 
     # ---------- Right-click for split ----------
     def on_canvas_right_click(self, event):
@@ -229,12 +608,7 @@ class PDFParaEditor:
         ux = self.canvas.canvasx(event.x) / self.zoom
         uy = self.canvas.canvasy(event.y) / self.zoom
 
-        paras = self.paragraphs_by_page.get(self.current_page, [])
-        clicked_idx = None
-        for idx, para in enumerate(paras):
-            if bbox_contains(para['bbox'], ux, uy):
-                clicked_idx = idx
-                break
+        clicked_idx = self.para_at(ux, uy)
         if clicked_idx is None:
             messagebox.showinfo("Split", "Right-click inside paragraph to set split point.")
             return
@@ -261,7 +635,7 @@ class PDFParaEditor:
             return
 
         pi = self.last_right_click['para_index']
-        paras = self.paragraphs_by_page[self.current_page]
+        paras = self._get_paras(self.current_page)
         if pi < 0 or pi >= len(paras):
             return
         para = paras[pi]
@@ -275,6 +649,7 @@ class PDFParaEditor:
             return
 
         self.push_undo()
+        self._drop_layout(self.current_page)
 
         left_words = words[:idx_word+1]
         right_words = words[idx_word+1:]
@@ -283,13 +658,9 @@ class PDFParaEditor:
             return
         left_text = " ".join(w[4] for w in left_words)
         right_text = " ".join(w[4] for w in right_words)
-        lx0, ly0 = min(w[0] for w in left_words), min(w[1] for w in left_words)
-        lx1, ly1 = max(w[2] for w in left_words), max(w[3] for w in left_words)
-        rx0, ry0 = min(w[0] for w in right_words), min(w[1] for w in right_words)
-        rx1, ry1 = max(w[2] for w in right_words), max(w[3] for w in right_words)
         paras.pop(pi)
-        paras.insert(pi, {'bbox': (rx0, ry0, rx1, ry1), 'text': right_text, 'words': right_words})
-        paras.insert(pi, {'bbox': (lx0, ly0, lx1, ly1), 'text': left_text, 'words': left_words})
+        paras.insert(pi, {'bbox': words_bbox(right_words), 'text': right_text, 'words': right_words})
+        paras.insert(pi, {'bbox': words_bbox(left_words), 'text': left_text, 'words': left_words})
 
         self.last_right_click = None
         if self.split_marker:
@@ -309,29 +680,27 @@ class PDFParaEditor:
             return
 
         pi = self.last_right_click['para_index']
-        paras = self.paragraphs_by_page[self.current_page]
+        paras = self._get_paras(self.current_page)
         if pi < 0 or pi >= len(paras):
             return
         para = paras[pi]
         x0, y0, x1, y1 = para['bbox']
         mid_x = (x0 + x1) / 2
-        # split words by x < mid_x
-        words_left = [w for w in para.get('words', []) if (w[0] + w[2]) / 2 <= mid_x]
-        words_right = [w for w in para.get('words', []) if (w[0] + w[2]) / 2 > mid_x]
+        # split words by x < mid_x, in one pass over the words
+        words_left, words_right = [], []
+        for w in para.get('words', []):
+            (words_left if (w[0] + w[2]) / 2 <= mid_x else words_right).append(w)
         if not words_left or not words_right:
             messagebox.showinfo("Split", "Cannot split vertically (no words on one side).")
             return
 
         self.push_undo()
+        self._drop_layout(self.current_page)
         left_text = " ".join(w[4] for w in words_left)
         right_text = " ".join(w[4] for w in words_right)
-        lx0, ly0 = min(w[0] for w in words_left), min(w[1] for w in words_left)
-        lx1, ly1 = max(w[2] for w in words_left), max(w[3] for w in words_left)
-        rx0, ry0 = min(w[0] for w in words_right), min(w[1] for w in words_right)
-        rx1, ry1 = max(w[2] for w in words_right), max(w[3] for w in words_right)
         paras.pop(pi)
-        paras.insert(pi, {'bbox': (rx0, ry0, rx1, ry1), 'text': right_text, 'words': words_right})
-        paras.insert(pi, {'bbox': (lx0, ly0, lx1, ly1), 'text': left_text, 'words': words_left})
+        paras.insert(pi, {'bbox': words_bbox(words_right), 'text': right_text, 'words': words_right})
+        paras.insert(pi, {'bbox': words_bbox(words_left), 'text': left_text, 'words': words_left})
         self.show_page()
         messagebox.showinfo("Split", f"P{pi+1} split vertically.")
 
@@ -340,37 +709,41 @@ class PDFParaEditor:
         if len(self.selected_indices) < 2:
             messagebox.showinfo("Merge", "Select 2+ adjacent paragraphs (Ctrl+Click).")
             return
-        paras = self.paragraphs_by_page[self.current_page]
+        paras = self._get_paras(self.current_page)
         sel = sorted(self.selected_indices)
-        for a, b in zip(sel, sel[1:]):
-            if b != a + 1:
-                messagebox.showwarning("Merge", "Selected must be adjacent.")
-                return
+        first, last = sel[0], sel[-1]
+        # indices are unique, so they are adjacent exactly when they span len(sel)
+        if last - first + 1 != len(sel):
+            messagebox.showwarning("Merge", "Selected must be adjacent.")
+            return
         self.push_undo()
-        first = sel[0]
-        merged_text = []
+        self._drop_layout(self.current_page)
+        group = paras[first:last + 1]
+        merged_bbox = group[0]['bbox']
         merged_words = []
-        merged_bbox = paras[first]['bbox']
-        # pop from end to keep indices stable
-        for idx in reversed(sel):
-            p = paras.pop(idx)
-            merged_text.insert(0, p['text'])
-            merged_words = p.get('words', []) + merged_words
+        for p in group:
             merged_bbox = bbox_merge(merged_bbox, p['bbox'])
-        paras.insert(first, {'bbox': merged_bbox, 'text': "\n".join(merged_text), 'words': merged_words})
+            merged_words.extend(p.get('words', []))
+        merged = {'bbox': merged_bbox, 'text': "\n".join(p['text'] for p in group), 'words': merged_words}
+        # one slice assignment instead of a pop per paragraph shifting the tail
+        paras[first:last + 1] = [merged]
         self.selected_indices = {first}
         self.show_page()
         messagebox.showinfo("Merge", f"Paragraphs merged into P{first+1}.")
 
     # ---------- Undo ----------
     def push_undo(self):
-        # store deep copy of paragraphs_by_page
-        self.undo_stack.append(copy.deepcopy(self.paragraphs_by_page))
+        # splits and merges only touch the current page, and they replace the
+        # paragraph dicts instead of mutating them: a shallow list copy is enough
+        self.undo_stack.append((self.current_page, list(self._get_paras(self.current_page))))
 
     def on_undo(self, event):
         if not self.undo_stack:
             return
-        self.paragraphs_by_page = self.undo_stack.pop()
+        pno, paras = self.undo_stack.pop()
+        self.paragraphs_by_page[pno] = paras
+        self._drop_layout(pno)
+        self.current_page = pno
         self.show_page()
 
     # ---------- Page navigation ----------
@@ -411,37 +784,43 @@ class PDFParaEditor:
 
     # ---------- Save paratag ----------
     def save_paratag(self):
-        if not self.paragraphs_by_page:
+        if not self.doc:
             return
         out = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")])
         if not out:
             return
-        data = {}
-        for pno, paras in self.paragraphs_by_page.items():
-            lst = []
-            for para in paras:
-                x0, y0, x1, y1 = para['bbox']
-                lst.append({'x1': x0, 'y1': y0, 'x2': x1, 'y2': y1, 'text': para['text']})
-            data[f"page_{pno+1}"] = lst
+        # one page at a time: each page is encoded as a one-key object and its
+        # braces are dropped, so the file matches a json.dump of the whole dict
         with open(out, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            sep = "{\n"
+            for pno, paras in self._get_all_paras():
+                lst = []
+                for para in paras:
+                    x0, y0, x1, y1 = para['bbox']
+                    lst.append({'x1': x0, 'y1': y0, 'x2': x1, 'y2': y1, 'text': para['text']})
+                f.write(sep)
+                f.write(json.dumps({f"page_{pno+1}": lst}, indent=2, ensure_ascii=False)[2:-2])
+                sep = ",\n"
+            f.write("\n}")
         messagebox.showinfo("Saved", "Paragraph tags saved.")
 
     # ---------- Export HTML ----------
     def export_html(self):
-        if not self.paragraphs_by_page:
+        if not self.doc:
             return
         out = filedialog.asksaveasfilename(defaultextension=".html", filetypes=[("HTML", "*.html")])
         if not out:
             return
-        lines = ["<!doctype html>", "<html><head><meta charset='utf-8'></head><body>"]
-        for pno, paras in sorted(self.paragraphs_by_page.items()):
-            for para in paras:
-                txt = para['text'].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-                lines.append(f"<p>{txt}</p>")
-        lines.append("</body></html>")
-        with open(out, "w", encoding="utf-8") as f:
-            f.write("\n".join(lines))
+        # a 1 MiB buffer turns the many small writes into a few large ones;
+        # text mode is kept so line endings match what export_html always wrote
+        with open(out, "w", encoding="utf-8", buffering=EXPORT_BUFFER) as f:
+            f.write("<!doctype html>\n<html><head><meta charset='utf-8'></head><body>")
+            for pno in range(len(self.doc)):
+                for para in self._get_paras(pno):
+                    f.write("\n<p>")
+                    f.write(para['text'].translate(HTML_ESCAPE))
+                    f.write("</p>")
+            f.write("\n</body></html>")
         messagebox.showinfo("Exported", "HTML exported.")
 
     # ---------- Save updated PDF ----------
@@ -460,7 +839,8 @@ class PDFParaEditor:
 
         try:
             # Just save a visual copy of the current PDF
-            self.doc.save(save_path)
+            with self._lock:
+                self.doc.save(save_path)
             messagebox.showinfo("Saved", f"PDF saved successfully to:\n{save_path}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save PDF:\n{e}")